@@ -1,64 +1,163 @@
-from classes import Job, Jobshop
-
-from pulp import *
-
-jobs = {}
-jobs[1] = Job(1, [1, 2, 3], [10, 8, 4])
-jobs[2] = Job(2, [2, 1, 4, 3], [8, 3, 5, 6])
-jobs[3] = Job(3, [1, 2, 4], [4, 7, 3])
-
-
-def LP(jobs):
-    """
-    A function that computes the linear programming optimization procedure for the Jobshop Scheduling Problem.
-    This is the disjunctive programming formulation.
-    Formulation from Pinedo 2009.
-    """
-    js = Jobshop()
-    js.addJobs(jobs)
-
-    prob = LpProblem("Job shop", LpMinimize)
-
-    H = sum(js.nodes[j]["p"] for j in js)
-    T = range(H + 1)
-
-    x = LpVariable.dicts("x", [(ij, t) for ij in js for t in T], 0, 1, cat=LpInteger)
-
-    ef = LpVariable.dicts("EF", [ij for ij in js])
-    for ij in js:
-        prob += ef[ij] == lpSum([t * x[(ij, t)] for t in T])
-
-    prob += ef["V"]
-
-    for ij in js:
-        prob += lpSum([x[(ij, t)] for t in T]) == 1
-
-    for ij in js:
-        prob += ef[ij] >= js.nodes[ij]["p"]
-
-    for ij in js:
-        for k in js.predecessors(ij):
-            prob += ef[ij] >= ef[k] + js.nodes[ij]["p"]
-
-    p = lambda ij, t: lpSum([x[(ij, u)] for u in range(t, t + js.nodes[ij]["p"])])
-
-    for i in js.machines:
-        for t in T:
-            prob += lpSum([p(ij, t) for ij in js.machines[i] if t <= H - js.nodes[ij]["p"] + 1]) <= 1
-
-    prob.solve(GUROBI())
-    # prob.solve()
-
-    print("status", LpStatus[prob.status])
-    print("objective", value(prob.objective))
-
-    for j in js:
-        for t in T:
-            if x[j, t].varValue > 0:
-                js.add_node(j, EF=t)
-
-    js.output()
-
-
-if __name__ == "__main__":
-    LP(jobs)
+import argparse
+import contextlib
+import os
+
+import carlier
+import localsearch
+import numpy as np
+
+from classes import Job, Jobshop, Shift
+
+from pulp import *
+
+jobs = {}
+jobs[1] = Job(1, [1, 2, 3], [10, 8, 4])
+jobs[2] = Job(2, [2, 1, 4, 3], [8, 3, 5, 6])
+jobs[3] = Job(3, [1, 2, 4], [4, 7, 3])
+
+
+def LP(jobs, solver=None):
+    """
+    A function that computes the linear programming optimization procedure for the Jobshop Scheduling Problem.
+    This is the time-indexed formulation, one binary per operation and time unit, so it only fits toy instances.
+    Formulation from Pinedo 2009.
+    solver: PuLP solver, e.g. GUROBI(), None for the bundled CBC
+    """
+    js = Jobshop()
+    js.addJobs(jobs)
+    G = js.to_networkx()
+
+    prob = LpProblem("Job shop", LpMinimize)
+
+    H = int(js.operations["p"].sum())
+    T = range(H + 1)
+
+    x = LpVariable.dicts("x", [(ij, t) for ij in G for t in T], 0, 1, cat=LpInteger)
+
+    ef = LpVariable.dicts("EF", [ij for ij in G])
+    for ij in G:
+        prob += ef[ij] == lpSum([t * x[(ij, t)] for t in T])
+
+    prob += ef["V"]
+
+    for ij in G:
+        prob += lpSum([x[(ij, t)] for t in T]) == 1
+
+    for ij in G:
+        prob += ef[ij] >= G.nodes[ij]["p"]
+
+    for ij in G:
+        for k in G.predecessors(ij):
+            prob += ef[ij] >= ef[k] + G.nodes[ij]["p"]
+
+    p = lambda ij, t: lpSum([x[(ij, u)] for u in range(t, t + G.nodes[ij]["p"])])
+
+    for i in js.machines:
+        for t in T:
+            prob += lpSum([p(js.key(ij), t) for ij in js.machines[i] if t <= H - js.p[ij] + 1]) <= 1
+
+    prob.solve(solver)
+
+    print("status", LpStatus[prob.status])
+    print("objective", value(prob.objective))
+
+    for m in sorted(js.machines):
+        for ij in sorted(js.machines[m], key=js.key):
+            for t in T:
+                if x[js.key(ij), t].varValue > 0:
+                    print("{}: {}".format(js.key(ij), t))
+
+
+def disjunctive(jobs, time_limit=None, warm_start=True, improve=1.0, msg=False):
+    """
+    A function that solves the Jobshop Scheduling Problem with the disjunctive (big-M) formulation and CBC.
+    One start time per operation and one binary per pair of operations of a machine, which is 1 when
+    the first one goes first. The start times are bounded by the heads (ES) of the job routing and
+    by the latest starts under the makespan of the shifting bottleneck, which also gives every pair
+    its own big-M and, with warm_start, is passed to CBC as the MIP start. A short tabu search on the
+    shifting bottleneck schedule tightens all of them. The one machine relaxations solved by Carlier
+    bound the makespan from below.
+    Formulation from Manne 1960.
+    time_limit: seconds of CBC, None for no limit
+    warm_start: start CBC from the shifting bottleneck schedule
+    improve: seconds of tabu search on the shifting bottleneck schedule, 0 to skip it
+    msg: show the CBC log
+    return: status, makespan and the start time of every (machine, job)
+    """
+    shift = Shift()
+    shift.addJobs(jobs)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        UB = shift.shiftting_bottleneck()
+    if improve:
+        UB = localsearch.tabu_search(shift, time_limit=improve)
+    js = Jobshop()
+    js.addJobs(jobs)
+    js.makespan()  # heads and tails of the job routing alone
+    n = len(js)
+    p = js.p.tolist()
+    ES = js.head.tolist()
+    # latest start of every operation in a schedule no longer than UB
+    LS = (UB - js.tail - js.p).tolist()
+    # the one machine relaxations solved by Carlier bound the makespan from below
+    LB = js.makespan()
+    for m in js.machines.values():
+        tasks = np.stack((js.head[m.ops], js.p[m.ops], js.tail[m.ops]), axis=1)
+        LB = max(LB, carlier.Carlier_np(tasks, UB=UB + 1, selection=True)[0])
+
+    prob = LpProblem("Job_shop", LpMinimize)
+    start = [LpVariable("s_{}".format(i), ES[i], LS[i]) for i in range(n)]
+    cmax = LpVariable("Cmax", LB, UB)
+    prob += cmax
+
+    for i in range(n):
+        j = int(js.job_next[i])
+        if j >= 0:
+            prob += start[j] >= start[i] + p[i]
+        else:
+            prob += cmax >= start[i] + p[i]
+
+    order = {}
+    for m in js.machines.values():
+        ops = m.ops.tolist()
+        for a, i in enumerate(ops):
+            for j in ops[a + 1 :]:
+                y = order[i, j] = LpVariable("y_{}_{}".format(i, j), cat=LpBinary)
+                # y == 1: i before j, the big-M is the largest violation left by the bounds
+                prob += start[i] + p[i] <= start[j] + max(0, LS[i] + p[i] - ES[j]) * (1 - y)
+                prob += start[j] + p[j] <= start[i] + max(0, LS[j] + p[j] - ES[i]) * y
+
+    if warm_start:
+        s = shift.head.tolist()
+        for i in range(n):
+            start[i].setInitialValue(s[i])
+        cmax.setInitialValue(UB)
+        for (i, j), y in order.items():
+            y.setInitialValue(1 if s[i] < s[j] else 0)
+
+    prob.solve(PULP_CBC_CMD(msg=msg, timeLimit=time_limit, warmStart=warm_start))
+    status = LpStatus[prob.status]
+    if status != "Optimal" and prob.sol_status not in (LpSolutionIntegerFeasible, LpSolutionOptimal):
+        return status, None, None
+    if prob.sol_status == LpSolutionIntegerFeasible:
+        # stopped by the time limit with a schedule
+        status = "Feasible"
+    return status, int(round(value(prob.objective))), {js.key(i): int(round(start[i].varValue)) for i in range(n)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a jobshop instance with the disjunctive MIP model and CBC.")
+    parser.add_argument("instance", nargs="?", default=None, help="instance file, default: the three-job example")
+    parser.add_argument("-t", "--time-limit", type=float, default=None, help="time limit of CBC in seconds")
+    parser.add_argument("--no-warm-start", action="store_true", help="do not start CBC from the Shift schedule")
+    parser.add_argument("--time-indexed", action="store_true", help="solve the time-indexed model instead")
+    args = parser.parse_args()
+    if args.instance is not None:
+        import run
+
+        jobs = run.read_file_to_jobs(args.instance)
+    if args.time_indexed:
+        LP(jobs)
+    else:
+        status, makespan, starts = disjunctive(jobs, args.time_limit, not args.no_warm_start)
+        print("status", status)
+        print("objective", makespan)
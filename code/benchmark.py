@@ -0,0 +1,407 @@
+"""
+Benchmarks of the solvers, saved as JSON baselines so a later run can be compared against them.
+
+The single machine suite times Schrage, preemptive Schrage, Carlier and Carlier with elimination
+on the data/SCHRAGE*.DAT instances and on random instances of any size. Every solver is timed
+as the best of "repeat" runs, its peak memory is measured in one extra run under tracemalloc
+(which slows it down, so it is never timed). The results of Carlier also hold the number of
+branch and bound nodes.
+
+The shifting bottleneck suite runs Shift on jobshop instances, chosen by name, glob pattern or
+dataset family of config.py. The time of every run is split into the phases of PhaseTimer
+(adding the jobs, the updates of heads and tails, computeLmax, reschedule and validation) and
+stored with the number of calls of every phase, the iterations and the makespan.
+
+Comparing against a baseline reports a regression when a solver got slower than the tolerance
+allows, or when its result (Cmax, lower bound or node count, makespan or iterations) changed.
+"""
+import argparse
+import contextlib
+import functools
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import carlier
+import config
+import loader
+import run
+from classes import Shift
+
+solvers = ["Schrage", "Schrage_pmtn", "Carlier", "Carlier_Elim"]
+
+# timings below this many seconds are too noisy to report as regressions
+min_time = 0.001
+
+
+def random_tasks(n, seed=0, p_max=50, k=20):
+    """
+        random single machine instance in the style of Carlier (1982): the processing times are
+        drawn from [1, p_max], the release and tail times from [1, n * k]
+    :param n: number of tasks
+    :param seed:
+    :param p_max:
+    :param k: spread of the release and tail times, the instances are hardest around 18 to 20
+    :return: (n, 3) array of release, processing and tail times
+    """
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        (rng.integers(1, n * k + 1, n), rng.integers(1, p_max + 1, n), rng.integers(1, n * k + 1, n))
+    )
+
+
+def schrage_instances(dir_name):
+    # data/SCHRAGE1.DAT ... SCHRAGE10.DAT in numeric order
+    files = glob.glob(os.path.join(dir_name, "SCHRAGE*.DAT"))
+    files.sort(key=lambda f: int(os.path.basename(f)[len("SCHRAGE") : -len(".DAT")]))
+    return [(os.path.basename(f), loader.read_schrage(f)) for f in files]
+
+
+def _run(solver, tasks, node_limit, time_limit, search, selection):
+    # one call of the solver, returns its result fields
+    if solver == "Schrage":
+        seq, Cmax = carlier.Schrage(tasks)
+        return {"cmax": Cmax}
+    if solver == "Schrage_pmtn":
+        return {"lb": carlier.Schrage_pmtn(tasks)}
+    s = carlier.CarlierSolver(
+        elimination=solver == "Carlier_Elim",
+        node_limit=node_limit,
+        time_limit=time_limit,
+        search=search,
+        selection=selection,
+    )
+    LB, UB, seq = s.solve(tasks)
+    return {"cmax": UB, "lb": LB, "nodes": s.nodes, "optimal": s.optimal}
+
+
+def measure(solver, tasks, repeat=3, node_limit=None, time_limit=None, search="depth", selection=False):
+    """
+        time a solver on the tasks [release time, process time, tail time]
+    :param solver: one of solvers
+    :param tasks:
+    :param repeat: number of timed runs, the best one is kept
+    :param node_limit: node limit of Carlier
+    :param time_limit: time limit in seconds of Carlier
+    :param search: search of Carlier, see carlier.CarlierSolver
+    :param selection: immediate selections of Carlier
+    :return: the result fields, "time" in seconds and "peak_kb" of memory
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        row = _run(solver, tasks, node_limit, time_limit, search, selection)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        _run(solver, tasks, node_limit, time_limit, search, selection)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    row["time"] = round(best, 6)
+    row["peak_kb"] = round(peak / 1024, 1)
+    return row
+
+
+def bench_carlier(
+    instances, names=solvers, repeat=3, node_limit=None, time_limit=None, search="depth", selection=False, log=None
+):
+    """
+        run the single machine suite
+    :param instances: (name, tasks) pairs
+    :param names: solvers to run
+    :param repeat:
+    :param node_limit:
+    :param time_limit:
+    :param search:
+    :param selection:
+    :param log: file the rows are printed to as they finish, None for no output
+    :return: the result rows
+    """
+    rows = []
+    for instance, tasks in instances:
+        tasks = np.asarray(tasks).tolist()
+        for solver in names:
+            row = {"instance": instance, "solver": solver, "n": len(tasks)}
+            try:
+                row.update(measure(solver, tasks, repeat, node_limit, time_limit, search, selection))
+            except (RecursionError, MemoryError) as e:
+                row["error"] = "{}: {}".format(type(e).__name__, e)
+            rows.append(row)
+            if log is not None:
+                print(_format(row), file=log, flush=True)
+    return rows
+
+
+def _format(row):
+    fields = ["cmax", "lb", "nodes", "makespan", "iterations", "time", "peak_kb", "error"]
+    return "{:<14s} {:<13s} ".format(row["instance"], row.get("solver", "Shift")) + " ".join(
+        "{}={}".format(f, row[f]) for f in fields if f in row
+    )
+
+
+class PhaseTimer(object):
+    """
+    A class that times the phases of a Shift by wrapping the methods of the instance.
+
+    The time of a phase is its own time only, the time spent in a nested phase is counted once,
+    in the nested phase (e.g. the "update" inside "reschedule").
+
+    Attributes
+    ----------
+    time: dict - Seconds spent in every phase
+    calls: dict - Number of calls of every phase
+    """
+
+    # method names of Shift and Jobshop and the phase they are counted in
+    phases = {
+        "addJobs": "addJobs",
+        "_update": "update",
+        "_compile": "compile",
+        "_forward": "forward",
+        "_forwardLevels": "forward",
+        "_propagateHeads": "forward",
+        "_backward": "backward",
+        "_backwardLevels": "backward",
+        "_propagateTails": "backward",
+        "_computeCriticalPath": "critical_path",
+        "computeLmax": "computeLmax",
+        "screenLmax": "computeLmax",
+        "reschedule": "reschedule",
+        "validate": "validate",
+    }
+
+    def __init__(self):
+        self.time = dict.fromkeys(self.phases.values(), 0.0)
+        self.calls = dict.fromkeys(self.phases.values(), 0)
+        self._stack = []
+
+    def attach(self, js):
+        for method, phase in self.phases.items():
+            setattr(js, method, self._wrap(getattr(js, method), phase))
+
+    def _wrap(self, func, phase):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            self._enter(phase)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+
+        return timed
+
+    def _enter(self, phase):
+        now = time.perf_counter()
+        if self._stack:
+            # pause the enclosing phase
+            parent = self._stack[-1]
+            self.time[parent[0]] += now - parent[1]
+        self.calls[phase] += 1
+        self._stack.append([phase, now])
+
+    def _exit(self):
+        now = time.perf_counter()
+        phase, start = self._stack.pop()
+        self.time[phase] += now - start
+        if self._stack:
+            self._stack[-1][1] = now
+
+
+def _shift_run(filename, time_limit, screening):
+    # one timed solve, the output of the procedure is discarded
+    timer = PhaseTimer()
+    js = Shift(time_limit=time_limit, screening=screening)
+    timer.attach(js)
+    jobs = run.read_file_to_jobs(filename)
+    start = time.perf_counter()
+    js.addJobs(jobs)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        js.shiftting_bottleneck()
+    elapsed = time.perf_counter() - start
+    phases = {phase: round(t, 6) for phase, t in timer.time.items()}
+    phases["other"] = round(max(0.0, elapsed - sum(timer.time.values())), 6)
+    return {
+        "jobs": len(jobs),
+        "machines": len(js.machines),
+        "makespan": js.makespan(),
+        "iterations": js.iterations,
+        "optimal": js.optimal,
+        "time": round(elapsed, 6),
+        "phases": phases,
+        "calls": dict(timer.calls),
+        "updates": js.updates,
+        "updates_avoided": js.updates_avoided,
+        "screened": js.screened,
+    }
+
+
+def bench_shift(names, dir_name, repeat=1, time_limit=None, screening=False, log=None):
+    """
+        run the shifting bottleneck suite, the time is split into the phases of PhaseTimer and
+        "other" (the bottleneck loop itself, e.g. inserting the machine sequences)
+    :param names: instance names
+    :param dir_name: directory of the instance files
+    :param repeat: number of timed runs, the fastest one is kept
+    :param time_limit: time limit in seconds of the procedure, see Shift
+    :param screening: screen the bottleneck candidates with bounds, see Shift
+    :param log: file the rows are printed to as they finish, None for no output
+    :return: the result rows
+    """
+    rows = []
+    for name in names:
+        row = {"instance": name}
+        runs = [_shift_run(os.path.join(dir_name, name), time_limit, screening) for _ in range(repeat)]
+        row.update(min(runs, key=lambda r: r["time"]))
+        best = config.best_known.get(name)
+        row["best_known"] = best
+        row["gap"] = round(100.0 * (row["makespan"] - best) / best, 2) if best else None
+        rows.append(row)
+        if log is not None:
+            top = sorted(row["phases"].items(), key=lambda x: -x[1])[:3]
+            print(_format(row) + " " + " ".join("{}={}".format(*x) for x in top), file=log, flush=True)
+    return rows
+
+
+def environment():
+    # where the baseline was measured, timings of different machines are not comparable
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def save(filename, suite, rows, settings):
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump({"suite": suite, "environment": environment(), "settings": settings, "results": rows}, f, indent=1)
+
+
+def load(filename):
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+def compare(baseline, rows, keys=("instance", "solver"), exact=("cmax", "lb", "nodes"), tolerance=0.25):
+    """
+        compare result rows against the rows of a baseline
+    :param baseline: loaded baseline file
+    :param rows:
+    :param keys: fields identifying a row
+    :param exact: fields that have to stay the same
+    :param tolerance: allowed relative slow down of "time"
+    :return: the regressions as messages
+    """
+    old = {tuple(r[k] for k in keys): r for r in baseline["results"]}
+    regressions = []
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        ref = old.get(key)
+        if ref is None:
+            continue
+        name = " ".join(str(k) for k in key)
+        for f in exact:
+            if ref.get(f) != row.get(f):
+                regressions.append("{}: {} changed from {} to {}".format(name, f, ref.get(f), row.get(f)))
+        if "time" in ref and "time" in row and row["time"] > max(ref["time"] * (1 + tolerance), min_time):
+            regressions.append("{}: time {}s -> {}s".format(name, ref["time"], row["time"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solvers and compare the results against a baseline.")
+    suites = parser.add_subparsers(dest="suite", required=True)
+
+    single = suites.add_parser("carlier", help="single machine solvers of carlier.py")
+    single.add_argument("-d", "--data", default="data/", help="directory of the SCHRAGE*.DAT instances")
+    single.add_argument("--no-data", action="store_true", help="skip the SCHRAGE*.DAT instances")
+    single.add_argument(
+        "-n", "--sizes", type=int, nargs="*", default=[10, 100, 1000, 10000], help="sizes of the random instances"
+    )
+    single.add_argument("-s", "--seeds", type=int, default=1, help="number of random instances per size")
+    single.add_argument("--solvers", nargs="*", default=solvers, choices=solvers, help="solvers to run")
+    single.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per solver, the best is kept")
+    single.add_argument("--node-limit", type=int, default=None, help="node limit of Carlier")
+    single.add_argument("--time-limit", type=float, default=None, help="time limit in seconds of Carlier")
+    single.add_argument("--search", default="depth", choices=carlier.CarlierSolver.searches, help="search of Carlier")
+    single.add_argument("--selection", action="store_true", help="immediate selections in every Carlier node")
+
+    shop = suites.add_parser("shift", help="shifting bottleneck procedure on jobshop instances")
+    shop.add_argument(
+        "instances",
+        nargs="*",
+        default=["ft"],
+        help="instance names, glob patterns or dataset families ({}), default: ft".format(", ".join(run.families)),
+    )
+    shop.add_argument("-d", "--dir", default="instances/", help="directory of the instance files")
+    shop.add_argument("-r", "--repeat", type=int, default=1, help="timed runs per instance, the fastest is kept")
+    shop.add_argument("--time-limit", type=float, default=None, help="time limit in seconds of the procedure")
+    shop.add_argument("--screening", action="store_true", help="screen the bottleneck candidates with bounds")
+
+    for p in (single, shop):
+        p.add_argument("-o", "--output", default=None, help="JSON file the results are saved to")
+        p.add_argument("-c", "--compare", default=None, help="JSON baseline to compare the results against")
+        p.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slow down")
+    args = parser.parse_args(argv)
+
+    if args.suite == "carlier":
+        instances = [] if args.no_data else schrage_instances(args.data)
+        for n in args.sizes:
+            instances.extend(("random{}_{}".format(n, seed), random_tasks(n, seed)) for seed in range(args.seeds))
+        settings = {
+            "sizes": args.sizes,
+            "seeds": args.seeds,
+            "repeat": args.repeat,
+            "node_limit": args.node_limit,
+            "time_limit": args.time_limit,
+            "search": args.search,
+            "selection": args.selection,
+        }
+        rows = bench_carlier(
+            instances,
+            args.solvers,
+            args.repeat,
+            args.node_limit,
+            args.time_limit,
+            args.search,
+            args.selection,
+            log=sys.stdout,
+        )
+        keys, exact = ("instance", "solver"), ("cmax", "lb", "nodes")
+    else:
+        names = run.select_instances(args.instances, args.dir)
+        settings = {
+            "instances": names,
+            "repeat": args.repeat,
+            "time_limit": args.time_limit,
+            "screening": args.screening,
+        }
+        rows = bench_shift(names, args.dir, args.repeat, args.time_limit, args.screening, log=sys.stdout)
+        keys, exact = ("instance",), ("makespan", "iterations")
+    if args.output:
+        save(args.output, args.suite, rows, settings)
+        print("results in {}".format(args.output))
+    if args.compare:
+        baseline = load(args.compare)
+        if baseline["suite"] != args.suite:
+            parser.error("{} is a baseline of the {} suite".format(args.compare, baseline["suite"]))
+        regressions = compare(baseline, rows, keys, exact, args.tolerance)
+        for message in regressions:
+            print(message, file=sys.stderr)
+        print("{} regressions against {}".format(len(regressions), args.compare))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,259 +1,444 @@
+import heapq
+import sys
 import time
-import operator
-
-
-def get_a(U, pi, tasks, b):
-    q = tasks[b][2]
-    idx_b = pi.index(b)
-    for val in pi:
-        p = 0
-        r = tasks[val][0]
-        mi = pi.index(val)
-        for a in range(mi, idx_b + 1):
-            p += tasks[pi[a]][1]
-        if U == r + p + q:
-            return val
-
-
-def get_b(U, pi, tasks):
-    p = 0
-    for val in pi:
-        r = tasks[val][0]
-        p = max(p, r) + tasks[val][1]
-        if U == p + tasks[val][2]:
-            j = val
-    return j
-
-
-def get_c(pi, tasks, a, b):
-    flag = 0
-    a = pi.index(a)
-    b = pi.index(b)
-    for val in range(a, b + 1):
-        if tasks[pi[val]][2] < tasks[pi[b]][2]:
-            j = pi[val]
-            flag = 1
-    if flag == 1:
-        return j
-    else:
-        return []
+
+import numpy as np
+
+import loader
+
+
+def critical_block(r, p, q, pi, start, U):
+    """
+        the critical path a .. b of a Schrage sequence and the task c of the path, in linear time
+    :param r: release times
+    :param p: processing times
+    :param q: tail times
+    :param pi: Schrage sequence
+    :param start: start times of the tasks of pi, in the order of pi
+    :param U: Cmax of the sequence
+    :return: the positions in pi of a, b and c, c is None when no task of the path has a smaller
+        tail than b
+    """
+    # b: the last task that completes at U - q_b
+    b = len(pi) - 1
+    while start[b] + p[pi[b]] + q[pi[b]] != U:
+        b -= 1
+    # a: the first task with r_a + p_a + ... + p_b + q_b == U, from the prefix sums of p
+    qb = q[pi[b]]
+    left = U - qb - sum(p[pi[k]] for k in range(b + 1))
+    a = 0
+    while r[pi[a]] != left:
+        left += p[pi[a]]
+        a += 1
+    # c: the last task of the path with a smaller tail than b
+    c = b - 1
+    while c >= a and q[pi[c]] >= qb:
+        c -= 1
+    return a, b, c if c >= a else None
+
+
+def immediate_selection(r, p, q, UB):
+    """
+        pairwise immediate selections in the style of Carlier and Pinson: when j before i gives
+        r_j + p_j + p_i + q_i >= UB, every sequence better than UB processes i before j, so
+        r_j >= r_i + p_i and q_i >= p_j + q_j. All pairs are handled in O(n log n) with prefix
+        maxima over the tasks sorted by p_i + q_i (heads) and r_j + p_j (tails).
+    :param r: release times, adjusted in place
+    :param p: processing times
+    :param q: tail times, adjusted in place
+    :param UB:
+    :return: the number of adjusted heads and tails
+    """
+    n = len(r)
+    rp = [r[i] + p[i] for i in range(n)]
+    pq = [p[i] + q[i] for i in range(n)]
+    new_r = _pair_max(pq, rp, [UB - v for v in rp])
+    new_q = _pair_max(rp, pq, [UB - v for v in pq])
+    count = 0
+    for j in range(n):
+        if new_r[j] > r[j]:
+            r[j] = new_r[j]
+            count += 1
+        if new_q[j] > q[j]:
+            q[j] = new_q[j]
+            count += 1
+    return count
+
+
+def _pair_max(key, value, threshold):
+    # for every j: the largest value[i] over the tasks i != j with key[i] >= threshold[j],
+    # -1 if there is none; the two largest values of every prefix exclude j itself
+    order = sorted(range(len(key)), key=key.__getitem__, reverse=True)
+    thresholds = sorted(range(len(key)), key=threshold.__getitem__, reverse=True)
+    best = [-1] * len(key)
+    first = second = -1
+    k = 0
+    for j in thresholds:
+        while k < len(order) and key[order[k]] >= threshold[j]:
+            i = order[k]
+            if first < 0 or value[i] > value[first]:
+                first, second = i, first
+            elif second < 0 or value[i] > value[second]:
+                second = i
+            k += 1
+        i = second if first == j else first
+        if i >= 0:
+            best[j] = value[i]
+    return best
+
+
+################################################### CARLIER BRANCH AND BOUND ##########################################
+class CarlierSolver(object):
+    """
+    A class that solves 1|r_j, q_j|Cmax with the branch and bound of Carlier.
+
+    The solver owns its incumbent, so several solvers can run at the same time, and it works
+    on a copy of the tasks, so the caller's lists are never modified. The root node always
+    runs, so when a node or time limit stops the search the incumbent is at least the Schrage
+    sequence of the tasks.
+
+    The open nodes, given by their release and tail times, are kept in an explicit stack
+    (depth-first, the order of the original recursion) or in a heap on their lower bound
+    (best-first), so deep searches don't hit the recursion limit. A node whose bound no longer
+    beats the incumbent when it is taken from the stack or heap is dropped without a Schrage.
+
+    Parameters
+    ----------
+    UB: int - Initial upper bound, only sequences better than it are kept
+    elimination: bool - Use the elimination rules in every node (Carlier_Elim) or not (Carlier)
+    node_limit: int - Maximum number of nodes to explore, None for no limit
+    time_limit: float - Maximum wall-clock seconds of the search, None for no limit
+    on_node: callable - Called with the node number, the Schrage Cmax (None if the immediate selections
+        pruned the node) and the lower bound of the node (None if it has no critical task) and the
+        seconds spent in it, None for no calls
+    search: str - "depth" for depth-first or "best" for best-first search
+    selection: bool - Apply the immediate selections (immediate_selection) in every node
+
+    Attributes
+    ----------
+    LB: int - Lower bound of the root node (preemptive Schrage)
+    UB: int - Cmax of the incumbent
+    sequence: list - Task indices of the incumbent, None if no sequence beat the initial UB
+    nodes: int - Number of explored nodes
+    pruned: int - Number of open nodes dropped by their bound
+    selections: int - Number of heads and tails adjusted by the immediate selections
+    optimal: bool - False if a limit cut the search, the incumbent may then not be optimal
+    """
+
+    searches = ("depth", "best")
+
+    def __init__(
+        self,
+        UB=sys.maxsize,
+        elimination=True,
+        node_limit=None,
+        time_limit=None,
+        on_node=None,
+        search="depth",
+        selection=False,
+    ):
+        if search not in self.searches:
+            raise ValueError("unknown search {!r}, expected one of {}".format(search, self.searches))
+        self.UB = UB
+        self.elimination = elimination
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.on_node = on_node
+        self.search = search
+        self.selection = selection
+        self.LB = None
+        self.sequence = None
+        self.nodes = 0
+        self.pruned = 0
+        self.selections = 0
+        self.optimal = True
+        self._deadline = None
+
+    def solve(self, tasks):
+        """
+            solve the tasks [release time, process time, tail time]
+        :param tasks:
+        :return: lower bound, upper bound and the sequence of the incumbent
+        """
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit
+        r = [task[0] for task in tasks]
+        p = [task[1] for task in tasks]
+        q = [task[2] for task in tasks]
+        # open nodes: (bound, tie, r, q), the heap pops the smallest bound, the most recent first
+        open_nodes = [(0, 0, r, q)]
+        count = 0
+        while open_nodes:
+            if self.search == "best":
+                bound, _, r, q = heapq.heappop(open_nodes)
+            else:
+                bound, _, r, q = open_nodes.pop()
+            if bound >= self.UB:
+                self.pruned += 1
+                continue
+            if self.nodes > 0 and self._stop():
+                break
+            for child in self._branch(r, p, q):
+                count += 1
+                if self.search == "best":
+                    heapq.heappush(open_nodes, (child[0], -count) + child[1:])
+                else:
+                    open_nodes.append((child[0], -count) + child[1:])
+        if self.LB is None:
+            self.LB = self.UB
+        return self.LB, self.UB, self.sequence
+
+    def _stop(self):
+        # called before exploring a node that could hold a better sequence
+        if (self.node_limit is not None and self.nodes >= self.node_limit) or (
+            self._deadline is not None and time.perf_counter() >= self._deadline
+        ):
+            self.optimal = False
+            return True
+        return False
+
+    def _branch(self, r, p, q):
+        # explore one node, returns its children as (bound, r, q), the second one is explored first
+        # by the depth-first search
+        self.nodes += 1
+        if self.on_node is not None:
+            start = time.perf_counter()
+        if self.selection and self.UB < sys.maxsize:
+            r, q = list(r), list(q)
+            self.selections += immediate_selection(r, p, q, self.UB)
+            if max(r[i] + p[i] + q[i] for i in range(len(r))) >= self.UB:
+                # the selections leave no sequence better than the incumbent
+                if self.on_node is not None:
+                    self.on_node(self.nodes, None, None, time.perf_counter() - start)
+                return []
+        order = sorted(range(len(r)), key=r.__getitem__)
+        pi, U, S = _schrage(order, r, p, q)
+        if U < self.UB:
+            self.UB = U
+            self.sequence = pi
+        a, b, c = critical_block(r, p, q, pi, S, U)
+        if c is None:
+            if self.on_node is not None:
+                self.on_node(self.nodes, U, None, time.perf_counter() - start)
+            return []
+        # the block K follows c on the critical path, positions are turned into tasks from here on
+        K = pi[c + 1 : b + 1]
+        L = pi[:c] + pi[b + 1 :]
+        b, c = pi[b], pi[c]
+
+        rK = min(r[i] for i in K)
+        qK = min(q[i] for i in K)
+        pK = sum(p[i] for i in K)
+        hK = rK + pK + qK
+        LB = _schrage_pmtn(order, r, p, q)
+        if self.LB is None:
+            self.LB = LB
+        if self.on_node is not None:
+            self.on_node(self.nodes, U, LB, time.perf_counter() - start)
+
+        if self.elimination:
+            # a task that doesn't fit between the tasks of K in a better sequence is processed
+            # before or after all of them
+            r, q = list(r), list(q)
+            for i in L:
+                if p[i] > self.UB - hK:
+                    if self.UB <= r[i] + p[i] + pK + qK:
+                        r[i] = max(r[i], rK + pK)
+                    if self.UB <= rK + p[i] + pK + q[i]:
+                        q[i] = max(q[i], qK + pK)
+
+        # c after all the tasks of K
+        r_after = list(r)
+        r_after[c] = max(r[c], rK + pK)
+        hkc = min(rK, r_after[c]) + pK + p[c] + min(qK, q[c])
+        LBL = max(hK, LB, hkc)
+        # c before all the tasks of K
+        q_before = list(q)
+        q_before[c] = max(q[c], qK + pK)
+        hkc = min(rK, r[c]) + pK + p[c] + min(qK, q_before[c])
+        LBP = max(hK, hkc, LB)
+        children = [(LBP, r, q_before), (LBL, r_after, q)]
+        return [child for child in children if child[0] < self.UB]
+
+
+def Carlier_np(tasks, UB=sys.maxsize, node_limit=None, time_limit=None, on_node=None, search="depth", selection=False):
+    """
+        Carlier_Elim for a NumPy (n, 3) array of release, processing and tail times
+    :param tasks:
+    :param UB: initial upper bound, e.g. the Cmax of a known sequence
+    :param node_limit:
+    :param time_limit:
+    :param on_node: see CarlierSolver
+    :param search: see CarlierSolver
+    :param selection: see CarlierSolver
+    :return: the Cmax and the sequence of the incumbent, None if nothing beat UB, whether
+        the sequence is optimal, the number of nodes and the seconds of the search
+    """
+    start = time.perf_counter()
+    solver = CarlierSolver(
+        UB=UB, node_limit=node_limit, time_limit=time_limit, on_node=on_node, search=search, selection=selection
+    )
+    LB, UB, seq = solver.solve(np.asarray(tasks).tolist())
+    return UB, seq, solver.optimal, solver.nodes, time.perf_counter() - start
+
+
+def sequence_Cmax(tasks, seq):
+    """
+        Cmax of the tasks [release time, process time, tail time] processed in the order seq
+    :param tasks:
+    :param seq:
+    :return:
+    """
+    t = 0
+    Cmax = 0
+    for j in seq:
+        t = max(t, tasks[j][0]) + tasks[j][1]
+        Cmax = max(Cmax, t + tasks[j][2])
+    return Cmax
 
 
 ################################################# CLASSICAL APPROACH #################################################
 def Carlier(tasks):
-    global UB
-    # global n
-    pi, U = Schrage(tasks)
-    if U < UB:
-        UB = U
-    b = get_b(U, pi, tasks)
-    a = get_a(U, pi, tasks, b)
-    c = get_c(pi, tasks, a, b)
-    if c == []:
-        return UB, tasks
-    K = []
-
-    for i in pi[pi.index(c) + 1 : pi.index(b) + 1]:
-        K.append(i)
-
-    rK = []
-    qK = []
-    pK = 0
-    for val in K:
-        rK.append(tasks[val][0])
-        qK.append(tasks[val][2])
-        pK += tasks[val][1]
-    qK = min(qK)
-    rK = min(rK)
-    rpq = [rK, pK, qK]
-    LB = Schrage_pmtn(tasks)
-    remember_R = tasks[c][0]
-    tasks[c][0] = max(tasks[c][0], rK + pK)
-    hkc = min(rK, tasks[c][0]) + pK + tasks[c][1] + min(qK, tasks[c][2])
-    LBL = max(sum(rpq), LB, hkc)
-    if LBL < UB:
-        Carlier(tasks)
-    tasks[c][0] = remember_R
-    remember_Q = tasks[c][2]
-    tasks[c][2] = max(tasks[c][2], qK + pK)
-    hkc = min(rK, tasks[c][0]) + pK + tasks[c][1] + min(qK, tasks[c][2])
-    LBP = max(sum(rpq), hkc, LB)
-    if LBP < UB:
-        Carlier(tasks)
-    tasks[c][2] = remember_Q
-    return UB
+    return CarlierSolver(elimination=False).solve(tasks)[1]
 
 
 ################################################### CARLIER WITH ELIMINATION ##########################################
 def Carlier_Elim(tasks):
-    global UB
-    # global n
-    pi, U = Schrage(tasks)
-    if U < UB:
-        UB = U
-    b = get_b(U, pi, tasks)
-    a = get_a(U, pi, tasks, b)
-    c = get_c(pi, tasks, a, b)
-    if c == []:
-        return UB, UB, pi
-    K = []
-
-    for i in pi[pi.index(c) + 1 : pi.index(b) + 1]:
-        K.append(i)
-
-    rK = []
-    qK = []
-    pK = 0
-    for i in K:
-        rK.append(tasks[i][0])
-        qK.append(tasks[i][2])
-        pK += tasks[i][1]
-    qK = min(qK)
-    rK = min(rK)
-    rpq = [rK, pK, qK]
-    LB = Schrage_pmtn(tasks)
-
-    L = []
-    for i in pi[0 : pi.index(c)]:
-        L.append(i)
-    for i in pi[pi.index(b) + 1 :]:
-        L.append(i)
-    for i in L:
-        if UB - sum(rpq) >= tasks[i][1]:
-            L.pop(L.index(i))
-
-    for i in L:
-        if UB <= tasks[i][0] + tasks[i][1] + rpq[1] + tasks[b][2]:
-            tasks[i][0] = max(tasks[i][0], rpq[0] + rpq[1])
-        if UB <= rpq[0] + tasks[i][1] + rpq[1] + tasks[i][2]:
-            tasks[i][2] = max(tasks[i][2], rpq[2] + rpq[1])
-
-    remember_R = tasks[c][0]
-    tasks[c][0] = max(tasks[c][0], rK + pK)
-    hkc = min(rK, tasks[c][0]) + pK + tasks[c][1] + min(qK, tasks[c][2])
-    LBL = max(sum(rpq), LB, hkc)
-    if LBL < UB:
-        Carlier_Elim(tasks)
-    tasks[c][0] = remember_R
-    remember_Q = tasks[c][2]
-    tasks[c][2] = max(tasks[c][2], qK + pK)
-    hkc = min(rK, tasks[c][0]) + pK + tasks[c][1] + min(qK, tasks[c][2])
-    LBP = max(sum(rpq), hkc, LB)
-    if LBP < UB:
-        Carlier_Elim(tasks)
-    tasks[c][2] = remember_Q
-    return LB, UB, pi
+    return CarlierSolver().solve(tasks)
 
 
 ############################################## SCHRAGE ALGORITHMS #####################################################
 def Schrage(N):
+    return Schrage_schedule(N)[:2]
+
+
+def Schrage_schedule(N):
+    """
+        Schrage with the schedule of the sequence
+    :param N: tasks [release time, process time, tail time]
+    :return: the sequence, its Cmax, and the start and completion times of the tasks in the order
+        of the sequence
+    """
+    r = [i[0] for i in N]
+    p = [i[1] for i in N]
+    q = [i[2] for i in N]
+    # ready queue: tasks ordered by release time, ties by task index
+    order = sorted(range(len(N)), key=r.__getitem__)
+    teta, Cmax, start = _schrage(order, r, p, q)
+    return teta, Cmax, start, [s + p[j] for s, j in zip(start, teta)]
+
+
+def Schrage_pmtn(N):
+    r = [i[0] for i in N]
+    p = [i[1] for i in N]
+    q = [i[2] for i in N]
+    order = sorted(range(len(N)), key=r.__getitem__)
+    return _schrage_pmtn(order, r, p, q)
+
+
+def Schrage_np(tasks):
+    """
+        Schrage for a NumPy (n, 3) array of release, processing and tail times
+    :param tasks:
+    :return: the sequence and its Cmax
+    """
+    tasks = np.asarray(tasks)
+    order = np.argsort(tasks[:, 0], kind="stable").tolist()
+    r, p, q = tasks.T.tolist()
+    return _schrage(order, r, p, q)[:2]
+
+
+def Schrage_pmtn_np(tasks):
+    """
+        preemptive Schrage for a NumPy (n, 3) array of release, processing and tail times
+    :param tasks:
+    :return: the preemptive Cmax (lower bound)
+    """
+    tasks = np.asarray(tasks)
+    order = np.argsort(tasks[:, 0], kind="stable").tolist()
+    r, p, q = tasks.T.tolist()
+    return _schrage_pmtn(order, r, p, q)
+
+
+def _schrage(order, r, p, q):
+    # the ready heap is keyed on the largest tail, ties go to the task released first
     teta = []
+    start = []
     NG = []
-    NN = []
-    a = 0
-    for i in N:
-        NN.append([a, i[0], i[1], i[2]])
-        a += 1
-    t = min(NN, key=operator.itemgetter(1))[1]
+    n = len(order)
+    k = 0
+    if n == 0:
+        return teta, 0, start
+    t = r[order[0]]
     Cmax = 0
-    while NN != [] or NG != []:
-        while NN != [] and t >= min(NN, key=operator.itemgetter(1))[1]:
-            j = NN.index(min(NN, key=operator.itemgetter(1)))
-            NG.append(NN[j])
-            NN.pop(j)
-
-        if NG == []:
-            t = min(NN, key=operator.itemgetter(1))[1]
+    while k < n or NG:
+        while k < n and t >= r[order[k]]:
+            j = order[k]
+            heapq.heappush(NG, (-q[j], k, j))
+            k += 1
+
+        if not NG:
+            t = r[order[k]]
         else:
-            i = NG.index(max(NG, key=operator.itemgetter(3)))
-            j = NG[i]
-            NG.pop(i)
-            teta.append(j[0])
-            t = t + j[2]
-            Cmax = max(Cmax, t + j[3])
-    return teta, Cmax
+            j = heapq.heappop(NG)[2]
+            teta.append(j)
+            start.append(t)
+            t = t + p[j]
+            Cmax = max(Cmax, t + q[j])
+    return teta, Cmax, start
 
 
-def Schrage_pmtn(N):
+def _schrage_pmtn(order, r, p, q):
+    # l is the task in process, a released task with a larger tail interrupts it
     NG = []
-    NN = []
-    a = 0
-    for i in N:
-        NN.append([a, i[0], i[1], i[2]])
-        a += 1
-    t = min(NN, key=operator.itemgetter(1))[1]
+    n = len(order)
+    k = 0
+    if n == 0:
+        return 0
+    left = list(p)
+    count = 0
+    t = r[order[0]]
     Cmax = 0
-    l = [0, 0, 0, 100000000]
-    while NN != [] or NG != []:
-        while NN != [] and t >= min(NN, key=operator.itemgetter(1))[1]:
-            j = NN.index(min(NN, key=operator.itemgetter(1)))
-            i = NN[j]
-            NG.append(NN[j])
-            NN.pop(j)
-            if i[3] > l[3]:
-                l[2] = t - i[1]
-                t = i[1]
-                if l[2] > 0:
-                    NG.append(l)
-        if NG == []:
-            t = min(NN, key=operator.itemgetter(1))[1]
+    l = None
+    while k < n or NG:
+        while k < n and t >= r[order[k]]:
+            i = order[k]
+            k += 1
+            heapq.heappush(NG, (-q[i], count, i))
+            count += 1
+            if l is not None and q[i] > q[l]:
+                left[l] = t - r[i]
+                t = r[i]
+                if left[l] > 0:
+                    heapq.heappush(NG, (-q[l], count, l))
+                    count += 1
+        if not NG:
+            t = r[order[k]]
         else:
-            i = NG.index(max(NG, key=operator.itemgetter(3)))
-            j = NG[i]
-            NG.pop(i)
+            j = heapq.heappop(NG)[2]
             l = j
-            t = t + j[2]
-            Cmax = max(Cmax, t + j[3])
+            t = t + left[j]
+            Cmax = max(Cmax, t + q[j])
     return Cmax
 
 
 def read_data_2list(filename):
     """
         data structure
-        task numbers, columns
+        task numbers
         <task 1 attr> release time, process time, tail time
     :param filename:
     :return:
     """
-    file = open(filename, "r")
-    tasks_val, columns_val = file.readline().split()
-    tasks_val = int(tasks_val)
-    columns_val = int(columns_val)
-    tasks = []
-    values = []
-    for val in file.read().split():
-        values.append(float(val))
-
-    for a in range(0, len(values), 3):
-        tmp_tab = []
-        for b in range(0, 3):
-            tmp_tab = tmp_tab + [values[a + b]]
-        tasks.append(tmp_tab)
-
-    file.close()
-    return tasks_val, columns_val, tasks
+    tasks = loader.read_schrage(filename)
+    return len(tasks), tasks.shape[1], tasks.tolist()
 
 
 if __name__ == "__main__":
-
-    # print("\nClassical algorithm")
-    # data = [0, 1, 3, 4]
-    # for i in data:
-    #     UB = 9999999
-    #     file = "data/carlier_data" + str(i) + ".txt"
-    #     tasks_val, columns_val, tasks = read_data_2list(file)
-    #     start = time.perf_counter()
-    #     UB = Carlier(tasks)
-    #     stop = time.perf_counter()
-    #     time = round((stop - start), 5)
-    #     print("{}  Result: {}  Time: {}".format(file, UB, time))
-
-    print("-" * 23)
+    # the full suite with timings and baselines is in benchmark.py
     print("With elimination")
-    data = [0, 1, 2, 3, 4, 5, 6, 7, 8]
-    for i in data:
-        UB = 9999999
-        file = "data/carlier_data" + str(i) + ".txt"
+    for i in range(1, 11):
+        file = "data/SCHRAGE" + str(i) + ".DAT"
         tasks_val, columns_val, tasks = read_data_2list(file)
         start = time.perf_counter()
         LB, UB, seq = Carlier_Elim(tasks)
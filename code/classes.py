@@ -1,5 +1,13 @@
 import sys
-from collections import defaultdict
+import copy
+import functools
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import networkx as nx
 from itertools import permutations
@@ -9,6 +17,83 @@ import numpy as np
 import carlier
 
 
+class ScheduleError(ValueError):
+    """
+    Raised when the graph of a jobshop is not a feasible schedule.
+    """
+
+
+class CycleError(ScheduleError):
+    """
+    Raised when the arcs of the jobshop graph contain a cycle.
+
+    Parameters
+    ----------
+    machine: int - Id of the machine whose sequence closed the cycle, None if unknown
+    """
+
+    def __init__(self, message, machine=None):
+        super().__init__(message)
+        self.machine = machine
+
+
+def csr_ranges(ptr, nodes):
+    """
+        positions of the CSR entries of the nodes
+    :param ptr: CSR index pointer
+    :param nodes:
+    :return: the positions, where the entries of every node start in them, and their counts
+    """
+    starts = ptr[nodes]
+    counts = ptr[nodes + 1] - starts
+    offsets = np.zeros(len(nodes), dtype=np.int64)
+    np.cumsum(counts[:-1], out=offsets[1:])
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum()), offsets, counts
+
+
+class OperationKeys(Sequence):
+    """
+    A read-only view of the (machine, job) keys of the operations of a jobshop, by operation id.
+    """
+
+    def __init__(self, shop):
+        self.shop = shop
+
+    def __len__(self):
+        return len(self.shop.operations)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        row = self.shop.operations[i]
+        return int(row["machine"]), int(row["job"])
+
+
+class OperationIds(Mapping):
+    """
+    A read-only view of the operation ids of a jobshop, by (machine, job) key.
+    """
+
+    def __init__(self, shop):
+        self.shop = shop
+
+    def __len__(self):
+        return len(self.shop.operations)
+
+    def __iter__(self):
+        return iter(self.shop.op_key)
+
+    def __getitem__(self, key):
+        # the operations of a job have consecutive ids, search its route for the machine
+        m, j = key
+        if j in self.shop._job_first:
+            first, n = self.shop._job_first[j]
+            found = np.flatnonzero(self.shop.operations["machine"][first : first + n] == m)
+            if len(found):
+                return first + int(found[0])
+        raise KeyError(key)
+
+
 def argmin_kv(d):
     """
     A function that returns the schedule with minimal lateness and the associated lateness.
@@ -16,6 +101,19 @@ def argmin_kv(d):
     return min(d.items(), key=lambda x: x[1])
 
 
+# one row of the operations table of a Jobshop
+operation_dtype = np.dtype(
+    [
+        ("machine", np.int32),
+        ("job", np.int32),
+        ("index", np.int32),  # position of the operation in the route of its job
+        ("p", np.int64),
+        ("head", np.int64),
+        ("tail", np.int64),
+    ]
+)
+
+
 class Job(object):
     """
     A class that creates jobs.
@@ -26,50 +124,220 @@ class Job(object):
     p: list - Processing times for every task
     """
 
+    __slots__ = ("Id", "r", "p")
+
     def __init__(self, Id, route, processing):
         self.Id = Id
         self.r = route  # route
         self.p = processing  # processing times
 
 
-# class Machine(object):
-#     def __init__(self, Id, lateness):
-#         self.Id = Id
-#         self.l = lateness
+class SequenceCache(object):
+    """
+    A LRU cache of single machine sequences keyed by the (r, p, q) array of the machine.
+
+    The cache is shared by the states of a beam expanded in threads, a lock guards the lookups,
+    the insertions and the counters.
+
+    Parameters
+    ----------
+    maxsize: int - Maximum number of sequences kept, 0 disables the cache
+
+    Attributes
+    ----------
+    hits: int - Number of lookups that found a sequence
+    misses: int - Number of lookups that did not
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # a lock can't be pickled, every process gets its own
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, tasks):
+        key = tasks.tobytes()
+        with self._lock:
+            seq = self._data.get(key)
+            if seq is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return seq
+
+    def put(self, tasks, seq):
+        if self.maxsize <= 0:
+            return
+        key = tasks.tobytes()
+        with self._lock:
+            self._data[key] = seq
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
 
+class Machine(object):
+    """
+    A class that holds the tasks processed on one machine.
+
+    The sequence inserted by "addMachineSequence" is kept until an arc of the machine changes,
+    "edges" and "sequence" read it instead of scanning the arcs of the tasks.
 
-class Jobshop(nx.DiGraph):
+    Parameters
+    ----------
+    Id: int - The machine id
+    ops: np.ndarray - Operation ids of the tasks processed on the machine
+    shop: Jobshop - The jobshop the machine belongs to
     """
-    A class that creates a directed graph of a jobshop.
 
-    We formulate the tasks of the jobshop as nodes in a directed graph, add the processing
-    times of the tasks as attributes to the task nodes. A flag "dirty" was added so when
-    some topological changes are carried the method "_update" is called first to update
-    the makespan and critical path values. Once the update is finished, the updated
-    makespan is returned.
+    def __init__(self, Id, ops, shop):
+        self.Id = Id
+        self.ops = ops
+        self.shop = shop
+        self._members = set(ops.tolist())
+        # the tasks in processing order when the arcs are exactly this chain, None when unknown
+        self._chain = None
+        self.lateness_max = sys.maxsize
+        self.node_sequence = None
+
+    def __iter__(self):
+        return iter(self.ops.tolist())
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __contains__(self, i):
+        return i in self._members
+
+    @property
+    def edges(self):
+        # disjunctive arcs between the tasks of this machine
+        if self._chain is not None:
+            return list(zip(self._chain[:-1], self._chain[1:]))
+        return [(u, v) for u in self.ops.tolist() for v in self.shop._dsucc[u] if v in self._members]
+
+    def sequence(self):
+        # the tasks in processing order, None if the machine is not sequenced as one chain
+        if self._chain is not None:
+            return list(self._chain)
+        succ = dict(self.edges)
+        first = self._members - set(succ.values())
+        if len(succ) != len(self) - 1 or len(first) != 1:
+            return None
+        seq = [first.pop()]
+        while seq[-1] in succ:
+            seq.append(succ[seq[-1]])
+        return seq if len(seq) == len(self) else None
+
+
+class Jobshop(object):
+    """
+    A class that holds the disjunctive graph of a jobshop in flat arrays.
+
+    Every task (operation) of the jobshop gets an integer id in the order the jobs are added.
+    The operations are the rows of the structured array "operations" (machine, job, index in the
+    route, processing time, head (release time) and tail), "p", "head" and "tail" are views of its
+    columns and "op_key"/"op_id" are (machine, job) keyed views for compatibility. The job
+    routing (conjunctive arcs) is fixed after "addJobs" and the machine sequences
+    (disjunctive arcs) are stored as adjacency sets. A flag "dirty" was added so when some
+    structural changes are carried the method "_update" is called first to compile the arcs
+    into CSR arrays and update the makespan and critical path values. The start node "U" and
+    the finishing node "V" are implicit. A networkx view of the graph is only built on request
+    through "to_networkx". So "len" counts the operations only, "number_of_nodes" still counts
+    "U" and "V" as the networkx graph did.
+
+    In incremental mode the topological order is kept up to date while arcs are inserted
+    (Pearce-Kelly) and "_update" only propagates the heads downstream and the tails upstream
+    of the arcs that changed since the last update. A full update is done after "addJobs" or
+    when an insertion closes a cycle.
+
+    A full update groups the operations into topological levels, the operations of a level
+    only depend on the ones of earlier levels. When the levels hold "level_width" operations
+    on average, the heads and tails are computed with one NumPy reduction per level, deeper
+    graphs (e.g. a complete schedule) are cheaper to walk operation by operation.
+
+    The structure (jobs, processing times and arcs) and the timing computed from it (heads,
+    tails, makespan and critical path) are kept apart: writing the heads or tails never marks the
+    graph dirty, and the arcs inserted or removed since the last update are kept as a set that
+    toggles, so arcs removed and inserted again cancel out. The timing is only recomputed when
+    the structure actually changed. The update also remembers the timing it replaced, so when
+    the arcs it followed are toggled back (e.g. "reschedule" removes the sequence of a machine
+    and Carlier returns the same sequence) the previous timing is restored without a pass.
+    Processing times are structure too: "p" is a read-only view and "setProcessingTime" marks
+    the neighbours of the operation for the next update.
+
+    Parameters
+    ----------
+    incremental: bool - Propagate heads and tails incrementally instead of full passes
+    instrumentation: Instrumentation - Gets an "update" event for every update, see instrument.py
+
+    Attributes
+    ----------
+    updates: int - Number of times the timing was recomputed
+    updates_avoided: int - Number of times the timing was up to date or restored instead
 
     Methods
     -------
     handleJobRouting(jobs)
-        Creates the edges of the graph that represents the given route and also adds
-        the origin and finishing nodes.
+        Creates the conjunctive arcs of the graph that represent the given routes.
 
     handleJobProcessingTimes(jobs)
-        Creates the nodes of the graph that represent the tasks of a job.
+        Creates the operations of the graph that represent the tasks of a job.
 
     makeMachineSubgraphs()
-        For every given machine creates a subgraph.
+        For every given machine creates a Machine with its operations.
 
     addJobs(jobs)
-        Handles the routine to add a jobs to the graph and the subgraphs.
+        Handles the routine to add a jobs to the graph and the machines.
+
+    removeJobs(job_ids)
+        Removes the operations of jobs and their arcs, the other operations get new ids.
+
+    setProcessingTime(i, p)
+        Changes the processing time of an operation.
+
+    key(i)
+        Returns the (machine, job) key of an operation.
+
+    to_networkx()
+        Builds a networkx.DiGraph view of the jobshop.
 
     output()
         Prints the output.
 
+    _compile
+
+    _computeLevels
+
+    _reorder
+
     _forward
 
     _backward
 
+    _forwardLevels
+
+    _backwardLevels
+
+    _propagateHeads
+
+    _propagateTails
+
     _computeCriticalPath
 
     _update
@@ -79,63 +347,252 @@ class Jobshop(nx.DiGraph):
     makespan
 
     criticalPath
+        The networkx subgraph of the critical nodes, keyed by (machine, job) with "U" and "V".
+
+    criticalOperations
+        The operation ids on the critical path.
 
     """
 
-    def __init__(self):
-        super().__init__()
-        # a dictionary to store machine's id of a subgraph with its jobs and routing
+    # minimum average number of operations per level for the level by level passes
+    level_width = 64
+
+    def __init__(self, incremental=True, instrumentation=None):
+        self.incremental = incremental
+        self.instrumentation = instrumentation
+        # a dictionary to store machine's id with its operations
         self.machines = {}
-        # start node
-        self.add_node("U", p=0)
-        # finish node
-        self.add_node("V", p=0)
-        # set dirty flag
+        # the Machine of every operation
+        self._machine_of = []
+        # machine, job, index in the route, processing time, head and tail of every operation
+        self.operations = np.zeros(0, dtype=operation_dtype)
+        # first operation id and number of operations of every job
+        self._job_first = {}
+        # (machine, job) key of every operation and the reverse lookup
+        self.op_key = OperationKeys(self)
+        self.op_id = OperationIds(self)
+        # job routing, -1 when the operation is the first/last of its job
+        self.job_prev = np.zeros(0, dtype=np.int64)
+        self.job_next = np.zeros(0, dtype=np.int64)
+        # disjunctive arcs
+        self._dsucc = []
+        self._dpred = []
+        self._n_arcs = 0
+        # CSR arrays of all (conjunctive and disjunctive) arcs
+        self.succ_ptr = self.succ_idx = self.pred_ptr = self.pred_idx = None
+        self._order = []
+        # operation ids of every topological level, valid after a full update
+        self._levels = []
+        # position of every operation in the topological order, valid after a full update
+        self._pos = []
+        self._order_valid = False
+        # operations whose head/tail may have changed since the last update
+        self._head_dirty = set()
+        self._tail_dirty = set()
+        # set dirty flag, the jobs changed and the next update is a full one
         self._dirty = True
+        # disjunctive arcs inserted or removed since the last update, (u, v) toggles in and out
+        self._arc_changes = set()
+        # a processing time changed since the last update
+        self._p_changed = False
+        # (arcs, head, tail, makespan, critical path) the last update followed and the timing before it
+        self._previous = None
+        self.updates = 0
+        self.updates_avoided = 0
         # set initial makespan
         self._makespan = -1
-        # define critical path # todo diff with criticalPath?
+        # operations on the critical path
         self._criticalPath = None
 
-    def add_node(self, *args, **kwargs):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().add_node(*args, **kwargs)
+    def __len__(self):
+        return len(self.operations)
 
-    def add_nodes_from(self, *args, **kwargs):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().add_nodes_from(*args, **kwargs)
+    # the columns of the operations table
+    @property
+    def op_machine(self):
+        return self.operations["machine"]
 
-    def add_edge(self, *args):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().add_edge(*args)
+    @property
+    def p(self):
+        # read-only, processing times are structure and change through setProcessingTime
+        view = self.operations["p"]
+        view.flags.writeable = False
+        return view
 
-    def add_edges_from(self, *args, **kwargs):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().add_edges_from(*args, **kwargs)
+    @property
+    def head(self):
+        # heads (ES)
+        return self.operations["head"]
 
-    def remove_node(self, *args, **kwargs):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().remove_node(*args, **kwargs)
+    @head.setter
+    def head(self, value):
+        self.operations["head"] = value
 
-    def remove_nodes_from(self, *args, **kwargs):
-        # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().remove_nodes_from(*args, **kwargs)
+    @property
+    def tail(self):
+        # tails (makespan - LF)
+        return self.operations["tail"]
 
-    def remove_edge(self, *args):
+    @tail.setter
+    def tail(self, value):
+        self.operations["tail"] = value
+
+    @property
+    def ES(self):
+        return self.head
+
+    @property
+    def EF(self):
+        return self.head + self.p
+
+    @property
+    def LF(self):
+        return self._makespan - self.tail
+
+    @property
+    def LS(self):
+        return self._makespan - self.tail - self.p
+
+    def key(self, i):
+        return int(self.operations["machine"][i]), int(self.operations["job"][i])
+
+    def successors(self, i):
+        j = int(self.job_next[i])
+        return ([j] if j >= 0 else []) + list(self._dsucc[i])
+
+    def predecessors(self, i):
+        j = int(self.job_prev[i])
+        return ([j] if j >= 0 else []) + list(self._dpred[i])
+
+    def number_of_nodes(self):
+        # operations plus the start and finishing nodes
+        return len(self.operations) + 2
+
+    def number_of_edges(self):
+        # routing arcs, arcs from "U" and to "V", and machine arcs
+        n_jobs = int(np.count_nonzero(self.job_prev < 0))
+        return int(np.count_nonzero(self.job_next >= 0)) + 2 * n_jobs + self._n_arcs
+
+    def add_edge(self, u, v):
         # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().remove_edge(*args)
+        if v not in self._dsucc[u]:
+            self._dsucc[u].add(v)
+            self._dpred[v].add(u)
+            self._n_arcs += 1
+            self._arc_changes ^= {(u, v)}
+            self._machine_of[u]._chain = None
+            if self.incremental and self._order_valid and self._pos[u] > self._pos[v]:
+                self._order_valid = self._reorder(u, v)
+            self._head_dirty.add(v)
+            self._tail_dirty.add(u)
+
+    def add_edges_from(self, edges):
+        for u, v in edges:
+            self.add_edge(u, v)
 
-    def remove_edges_from(self, *args, **kwargs):
+    def remove_edge(self, u, v):
         # adds dirty flag so the the _update subroutine is called
-        self._dirty = True
-        super().remove_edges_from(*args, **kwargs)
+        self._dsucc[u].remove(v)
+        self._dpred[v].remove(u)
+        self._n_arcs -= 1
+        self._arc_changes ^= {(u, v)}
+        self._machine_of[u]._chain = None
+        # removing an arc keeps the topological order valid
+        self._head_dirty.add(v)
+        self._tail_dirty.add(u)
+
+    def remove_edges_from(self, edges):
+        for u, v in edges:
+            self.remove_edge(u, v)
+
+    def setProcessingTime(self, i, p):
+        """
+            change the processing time of an operation, the timing is recomputed on the next update
+        :param i: operation id
+        :param p: new processing time
+        :return:
+        """
+        if p == self.operations["p"][i]:
+            return
+        self.operations["p"][i] = p
+        self._p_changed = True
+        # the timing before the last update was computed with the old processing time
+        self._previous = None
+        self._head_dirty.update(self.successors(i))
+        self._tail_dirty.update(self.predecessors(i))
+
+    def addMachineSequence(self, m, node_seq):
+        """
+            add the arcs of a machine sequence, the arcs are only kept if they don't close a cycle
+        :param m: machine id
+        :param node_seq: operation ids in processing order
+        :return:
+        """
+        edges_seq = list(zip(node_seq[:-1], node_seq[1:]))
+        machine = self.machines[m]
+        # the sequence is the chain of the machine if it has no other arcs and holds every task
+        chain = len(node_seq) == len(machine) and not machine.edges
+        if not (self.incremental and self._order_valid):
+            self.add_edges_from(edges_seq)
+            try:
+                self._compile()
+            except CycleError:
+                self.remove_edges_from(edges_seq)
+                raise CycleError("the sequence of machine {} closes a cycle".format(m), machine=m)
+        else:
+            # the dynamic topological order finds the cycle while the arcs are inserted
+            for k, (u, v) in enumerate(edges_seq):
+                self.add_edge(u, v)
+                if not self._order_valid:
+                    self.remove_edges_from(edges_seq[: k + 1])
+                    # the order was not changed by the failed insertion and the other arcs respect it
+                    self._order_valid = True
+                    raise CycleError("the sequence of machine {} closes a cycle".format(m), machine=m)
+        if chain:
+            machine._chain = list(node_seq)
+
+    def machineSequences(self):
+        """
+            the sequence of every machine as job ids, e.g. to store a schedule
+        :return: {machine id: [job ids in processing order]}, without the machines that are not
+            sequenced as one chain
+        """
+        job = self.operations["job"].tolist()
+        sequences = {}
+        for m, machine in self.machines.items():
+            seq = machine.sequence()
+            if seq is not None:
+                sequences[m] = [job[i] for i in seq]
+        return sequences
+
+    def validate(self):
+        """
+            check that the graph is a feasible schedule: every machine is sequenced as one chain,
+            the graph is acyclic, and the earliest start times follow the job routes and never
+            overlap on a machine
+        :return:
+        """
+        for m, machine in self.machines.items():
+            edges = machine.edges
+            heads, tails = {u for u, v in edges}, {v for u, v in edges}
+            if len(edges) != len(machine) - 1 or len(heads) != len(edges) or len(tails) != len(edges):
+                raise ScheduleError("machine {} is not sequenced as a single chain".format(m))
+        makespan = self.makespan()  # raises CycleError
+        start = self.head
+        finish = self.head + self.p
+        has_next = np.flatnonzero(self.job_next >= 0)
+        late = has_next[start[self.job_next[has_next]] < finish[has_next]]
+        if len(late):
+            key = self.key(self.job_next[late[0]])
+            raise ScheduleError("operation {} starts before the end of the previous task of its job".format(key))
+        for m, machine in self.machines.items():
+            order = machine.ops[np.argsort(start[machine.ops], kind="stable")]
+            overlap = np.flatnonzero(start[order[1:]] < finish[order[:-1]])
+            if len(overlap):
+                u, v = self.key(order[overlap[0]]), self.key(order[overlap[0] + 1])
+                raise ScheduleError("operations {} and {} overlap on machine {}".format(u, v, m))
+        if makespan != finish.max(initial=0):
+            raise ScheduleError("makespan {} does not match the schedule".format(makespan))
 
     def handleJobRouting(self, jobs):
         """
@@ -143,14 +600,19 @@ class Jobshop(nx.DiGraph):
         :param jobs:
         :return:
         """
+        prev = []
+        nxt = []
+        i = len(self.operations)
         for j in jobs.values():
-            # add start edge
-            self.add_edge("U", (j.r[0], j.Id))
-            # add the edges (processing order) routing the nodes (tasks)
-            for m, n in zip(j.r[:-1], j.r[1:]):
-                self.add_edge((m, j.Id), (n, j.Id))
-            # add finishing edge
-            self.add_edge((j.r[-1], j.Id), "V")
+            # the tasks of a job get consecutive ids, so the routing is a chain of ids
+            n = len(j.r)
+            prev.extend([-1] + list(range(i, i + n - 1)))
+            nxt.extend(list(range(i + 1, i + n)) + [-1])
+            i += n
+        self.job_prev = np.concatenate((self.job_prev, np.array(prev, dtype=np.int64)))
+        self.job_next = np.concatenate((self.job_next, np.array(nxt, dtype=np.int64)))
+        self._order_valid = False
+        self._dirty = True
 
     def handleJobProcessingTimes(self, jobs):
         """
@@ -158,221 +620,930 @@ class Jobshop(nx.DiGraph):
         :param jobs:
         :return:
         """
+        first = len(self.operations)
+        ops = np.zeros(sum(len(j.r) for j in jobs.values()), dtype=operation_dtype)
+        i = 0
         for j in jobs.values():
-            # add every task and its corresponding processing time to the graph
-            for m, p in zip(j.r, j.p):
-                self.add_node((m, j.Id), p=p)
+            # add every task and its corresponding processing time
+            n = len(j.r)
+            self._job_first[j.Id] = (first + i, n)
+            ops["machine"][i : i + n] = j.r
+            ops["job"][i : i + n] = j.Id
+            ops["index"][i : i + n] = np.arange(n)
+            ops["p"][i : i + n] = j.p
+            i += n
+        self._dsucc.extend(set() for _ in range(len(ops)))
+        self._dpred.extend(set() for _ in range(len(ops)))
+        self.operations = np.concatenate((self.operations, ops))
+        # the heads and tails are computed again by the next update
+        self.head = 0
+        self.tail = 0
+        self._dirty = True
 
     def makeMachineSubgraph(self):
-        # creates a set with machines' ids
-        machine_ids = set(node[0] for node in self if node not in ("U", "V"))
-        # for every machine in the digraph creates a subgraph linked to the id with the corresponding nodes
-        for m in machine_ids:
-            self.machines[m] = self.subgraph(node for node in self if node not in ("U", "V") and node[0] == m)
-            # self.machines[m].remove_nodes_from(["U", "V"])
+        # group the operation ids by machine with a stable sort, so every machine keeps the job order
+        order = np.argsort(self.op_machine, kind="stable")
+        machine_ids, first = np.unique(self.op_machine[order], return_index=True)
+        for m, ops in zip(machine_ids.tolist(), np.split(order, first[1:])):
+            self.machines[m] = Machine(m, ops, self)
+        # the Machine of every operation
+        self._machine_of = [self.machines[m] for m in self.op_machine.tolist()]
 
     def addJobs(self, jobs):
-        # every time a job is inserted: add the jobs' edges (routing), jobs' nodes (tasks),
-        # and creates a subgraph for every machine
-        self.handleJobRouting(jobs)  # edge: ((task_Id, job_Id), (task_Id, job_Id))
-        self.handleJobProcessingTimes(jobs)  # node: ((task_Id, job_Id), p), p is the process time
-        self.makeMachineSubgraph()  # subgraph of the Shift to represent the machine
+        # every time a job is inserted: add the jobs' nodes (tasks), jobs' edges (routing),
+        # and creates a Machine for every machine
+        self.handleJobRouting(jobs)  # job_prev/job_next: chain of operation ids
+        self.handleJobProcessingTimes(jobs)  # operations[i] = (machine, job, index, p, head, tail)
+        self.makeMachineSubgraph()  # operations of the Shift processed on every machine
+
+    def removeJobs(self, job_ids):
+        """
+            remove jobs with their operations and the arcs from and to them, the operations left
+            are numbered again in the same order
+        :param job_ids:
+        :return: the new id of every old operation id, -1 for the removed ones
+        """
+        keep = np.ones(len(self.operations), dtype=bool)
+        for j in job_ids:
+            if j not in self._job_first:
+                raise ValueError("unknown job {!r}".format(j))
+            first, n = self._job_first[j]
+            keep[first : first + n] = False
+        new_id = np.full(len(self.operations), -1, dtype=np.int64)
+        new_id[keep] = np.arange(int(keep.sum()))
+        ids = new_id.tolist()
+        kept = np.flatnonzero(keep).tolist()
+        self._dsucc = [{ids[v] for v in self._dsucc[u] if ids[v] >= 0} for u in kept]
+        self._dpred = [{ids[v] for v in self._dpred[u] if ids[v] >= 0} for u in kept]
+        self._n_arcs = sum(len(s) for s in self._dsucc)
+        # whole jobs are removed, so the routing neighbours of a kept operation are kept
+        for name in ("job_prev", "job_next"):
+            routing = getattr(self, name)[keep]
+            setattr(self, name, np.where(routing >= 0, new_id[routing], -1))
+        self._job_first = {j: (ids[first], n) for j, (first, n) in self._job_first.items() if j not in job_ids}
+        self.operations = self.operations[keep]
+        self.machines = {}
+        self.makeMachineSubgraph()
+        # the next update is a full one
+        self._order_valid = False
+        self._head_dirty = set()
+        self._tail_dirty = set()
+        self._arc_changes = set()
+        self._previous = None
+        self._dirty = True
+        return new_id
+
+    def to_networkx(self):
+        """
+            build a networkx.DiGraph view keyed by (machine, job) with the start node "U"
+            and the finishing node "V"
+        :return:
+        """
+        self._refresh()
+        G = nx.DiGraph()
+        G.add_node("U", p=0, ES=0, EF=0, LS=0, LF=0)
+        G.add_node("V", p=0, ES=self._makespan, EF=self._makespan, LS=self._makespan, LF=self._makespan)
+        ES, EF, LS, LF = self.ES.tolist(), self.EF.tolist(), self.LS.tolist(), self.LF.tolist()
+        keys = list(zip(self.op_machine.tolist(), self.operations["job"].tolist()))
+        p = self.p.tolist()
+        for i, k in enumerate(keys):
+            G.add_node(k, p=p[i], ES=ES[i], EF=EF[i], LS=LS[i], LF=LF[i])
+        for i, k in enumerate(keys):
+            if self.job_prev[i] < 0:
+                G.add_edge("U", k)
+            if self.job_next[i] < 0:
+                G.add_edge(k, "V")
+            else:
+                G.add_edge(k, keys[self.job_next[i]])
+            for j in self._dsucc[i]:
+                G.add_edge(k, keys[j])
+        return G
 
     def output(self):
-        # neatly outputs the jobshop digraph
+        # neatly outputs the jobshop schedule
+        EF = self.EF.tolist()
         for m in sorted(self.machines):
-            for j in sorted(self.machines[m]):
-                print("{}: {}".format(j, self.nodes[j]["EF"]))
+            for j in sorted(self.machines[m], key=self.key):
+                print("{}: {}".format(self.key(j), EF[j]))
+
+    def _compile(self):
+        # compile the conjunctive and disjunctive arcs into CSR arrays and a topological order
+        n = len(self.operations)
+        src = [u for u in range(n) for _ in self._dsucc[u]]
+        dst = [v for u in range(n) for v in self._dsucc[u]]
+        has_next = np.flatnonzero(self.job_next >= 0)
+        src = np.concatenate((has_next, np.array(src, dtype=np.int64)))
+        dst = np.concatenate((self.job_next[has_next], np.array(dst, dtype=np.int64)))
+        self.succ_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.succ_ptr[1:])
+        self.succ_idx = dst[np.argsort(src, kind="stable")]
+        self.pred_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dst, minlength=n), out=self.pred_ptr[1:])
+        self.pred_idx = src[np.argsort(dst, kind="stable")]
+        self._levels = self._computeLevels()
+        order = np.concatenate(self._levels) if self._levels else np.zeros(0, dtype=np.int64)
+        if len(order) < n:
+            raise CycleError("the jobshop graph contains a cycle")
+        pos = np.empty(n, dtype=np.int64)
+        pos[order] = np.arange(n)
+        self._order = order.tolist()
+        self._pos = pos.tolist()
+        self._order_valid = True
+
+    def _computeLevels(self):
+        # Kahn's algorithm one frontier at a time, the operations left in a cycle are never reached
+        indegree = np.diff(self.pred_ptr)
+        frontier = np.flatnonzero(indegree == 0)
+        levels = []
+        while len(frontier):
+            levels.append(frontier)
+            succ = self.succ_idx[csr_ranges(self.succ_ptr, frontier)[0]]
+            np.subtract.at(indegree, succ, 1)
+            frontier = np.unique(succ[indegree[succ] == 0])
+        return levels
+
+    def _reorder(self, u, v):
+        # Pearce-Kelly: after inserting u -> v with pos[u] > pos[v], shift the operations reachable
+        # from v behind the ones reaching u, inside the affected window [pos[v], pos[u]]
+        pos = self._pos
+        lb, ub = pos[v], pos[u]
+        forward = [v]
+        seen = {v}
+        for n in forward:
+            for s in self.successors(n):
+                if s == u:
+                    # the arc closes a cycle, the next update does a full pass and reports it
+                    return False
+                if s not in seen and pos[s] < ub:
+                    seen.add(s)
+                    forward.append(s)
+        backward = [u]
+        seen = {u}
+        for n in backward:
+            for s in self.predecessors(n):
+                if s not in seen and pos[s] > lb:
+                    seen.add(s)
+                    backward.append(s)
+        backward.sort(key=pos.__getitem__)
+        forward.sort(key=pos.__getitem__)
+        moved = backward + forward
+        for n, k in zip(moved, sorted(pos[n] for n in moved)):
+            self._order[k] = n
+            pos[n] = k
+        return True
 
     def _forward(self):
-        # Calculate the earliest occurrence time of arc according to forward topological ordering
-        for n in nx.topological_sort(self):
-            es = max([self.nodes[j]["EF"] for j in self.predecessors(n)], default=0)
-            # ES==>earliest start time(release time), EF==>earliest finished time
-            # makespan = max(EF)
-            self.add_node(n, ES=es, EF=es + self.nodes[n]["p"])
+        # Calculate the earliest start time (head) according to forward topological ordering
+        # ES==>earliest start time(release time), EF==>earliest finished time
+        ptr = self.pred_ptr.tolist()
+        idx = self.pred_idx.tolist()
+        p = self.p.tolist()
+        head = [0] * len(p)
+        for n in self._order:
+            es = 0
+            for k in range(ptr[n], ptr[n + 1]):
+                j = idx[k]
+                if head[j] + p[j] > es:
+                    es = head[j] + p[j]
+            head[n] = es
+        self.head = np.array(head, dtype=np.int64)
 
     def _backward(self):
-        # Calculate the latest occurrence time of arcs according to forward topological ordering
-        for n in list(reversed(list(nx.topological_sort(self)))):
-            lf = min([self.nodes[j]["LS"] for j in self.successors(n)], default=self._makespan)
-            # LS==>latest start time LF==>latest finished time(due date)
-            self.add_node(n, LS=lf - self.nodes[n]["p"], LF=lf)
+        # Calculate the tail according to backward topological ordering
+        # LF==>latest finished time(due date) = makespan - tail
+        ptr = self.succ_ptr.tolist()
+        idx = self.succ_idx.tolist()
+        p = self.p.tolist()
+        tail = [0] * len(p)
+        for n in reversed(self._order):
+            q = 0
+            for k in range(ptr[n], ptr[n + 1]):
+                j = idx[k]
+                if tail[j] + p[j] > q:
+                    q = tail[j] + p[j]
+            tail[n] = q
+        self.tail = np.array(tail, dtype=np.int64)
+
+    def _forwardLevels(self):
+        # the heads of a level are the largest EF of the predecessors, the first level has none
+        head = np.zeros(len(self.operations), dtype=np.int64)
+        for level in self._levels[1:]:
+            k, offsets, counts = csr_ranges(self.pred_ptr, level)
+            pred = self.pred_idx[k]
+            head[level] = np.maximum.reduceat(head[pred] + self.p[pred], offsets)
+        self.head = head
+
+    def _backwardLevels(self):
+        # the tails of a level are the largest tail + p of the successors, 0 without successors
+        tail = np.zeros(len(self.operations), dtype=np.int64)
+        for level in reversed(self._levels):
+            k, offsets, counts = csr_ranges(self.succ_ptr, level)
+            has_succ = counts > 0
+            if has_succ.any():
+                succ = self.succ_idx[k]
+                tail[level[has_succ]] = np.maximum.reduceat(tail[succ] + self.p[succ], offsets[has_succ])
+        self.tail = tail
+
+    def _propagateHeads(self):
+        # recompute the heads of the changed operations in topological order and only
+        # follow the successors of an operation whose head actually changed
+        pos = self._pos
+        p = self.p.tolist()
+        job_prev = self.job_prev.tolist()
+        job_next = self.job_next.tolist()
+        head = self.head.tolist()
+        heap = [(pos[n], n) for n in self._head_dirty]
+        heapq.heapify(heap)
+        queued = set(self._head_dirty)
+        while heap:
+            _, n = heapq.heappop(heap)
+            j = job_prev[n]
+            es = head[j] + p[j] if j >= 0 else 0
+            for j in self._dpred[n]:
+                if head[j] + p[j] > es:
+                    es = head[j] + p[j]
+            if es != head[n]:
+                head[n] = es
+                j = job_next[n]
+                for s in ([j] if j >= 0 else []) + list(self._dsucc[n]):
+                    if s not in queued:
+                        queued.add(s)
+                        heapq.heappush(heap, (pos[s], s))
+        self.head = np.array(head, dtype=np.int64)
+
+    def _propagateTails(self):
+        # same as _propagateHeads in reverse topological order
+        pos = self._pos
+        p = self.p.tolist()
+        job_prev = self.job_prev.tolist()
+        job_next = self.job_next.tolist()
+        tail = self.tail.tolist()
+        heap = [(-pos[n], n) for n in self._tail_dirty]
+        heapq.heapify(heap)
+        queued = set(self._tail_dirty)
+        while heap:
+            _, n = heapq.heappop(heap)
+            j = job_next[n]
+            q = tail[j] + p[j] if j >= 0 else 0
+            for j in self._dsucc[n]:
+                if tail[j] + p[j] > q:
+                    q = tail[j] + p[j]
+            if q != tail[n]:
+                tail[n] = q
+                j = job_prev[n]
+                for s in ([j] if j >= 0 else []) + list(self._dpred[n]):
+                    if s not in queued:
+                        queued.add(s)
+                        heapq.heappush(heap, (-pos[s], s))
+        self.tail = np.array(tail, dtype=np.int64)
 
     def _computeCriticalPath(self):
         # If earliest finished time == latest finished time,
         # the node is a critical activity on the critical path
-        G = set()
-        for n in self:
-            if self.nodes[n]["EF"] == self.nodes[n]["LF"]:
-                G.add(n)
-        self._criticalPath = self.subgraph(G)
+        self._criticalPath = np.flatnonzero(self.head + self.p + self.tail == self._makespan)
 
     def makespan(self):
-        if self._dirty:
-            self._update()
+        self._refresh()
         return self._makespan
 
     def criticalPath(self):
-        if self._dirty:
-            self._update()
+        # the critical nodes of the networkx view, "U" and "V" are always critical
+        self._refresh()
+        keys = [self.key(i) for i in self._criticalPath.tolist()]
+        return self.to_networkx().subgraph(["U", "V"] + keys)
+
+    def criticalOperations(self):
+        self._refresh()
         return self._criticalPath
 
+    def _refresh(self):
+        # recompute the timing only if the structure changed since the last update
+        if self._dirty or self._p_changed:
+            self._update()
+        elif not self._arc_changes:
+            # nothing changed or the changes cancelled out
+            self._head_dirty = set()
+            self._tail_dirty = set()
+            self.updates_avoided += 1
+        elif self._previous is not None and self._previous[0] == self._arc_changes:
+            self._restore()
+        else:
+            self._update()
+
+    def _restore(self):
+        # the arcs of the last update were toggled back, swap in the timing before it
+        if self.instrumentation is not None:
+            start = time.perf_counter()
+        arcs, head, tail, makespan, critical = self._previous
+        self._previous = (arcs, self.head.copy(), self.tail.copy(), self._makespan, self._criticalPath)
+        self.head, self.tail = head, tail
+        self._makespan, self._criticalPath = makespan, critical
+        self._arc_changes = set()
+        self._head_dirty = set()
+        self._tail_dirty = set()
+        self.updates_avoided += 1
+        if self.instrumentation is not None:
+            self.instrumentation.update("restore", 0, 0, self._makespan, time.perf_counter() - start)
+
     def _update(self):
-        self._forward()
-        self._makespan = max(nx.get_node_attributes(self, "EF").values())
-        self._backward()
+        if self.instrumentation is not None:
+            start = time.perf_counter()
+            heads, tails = len(self._head_dirty), len(self._tail_dirty)
+        if self._dirty or self._p_changed:
+            previous = None
+        else:
+            previous = (frozenset(self._arc_changes), self.head.copy(), self.tail.copy())
+            previous += (self._makespan, self._criticalPath)
+        # a pending full update (e.g. after addJobs) has no heads and tails to propagate from, even
+        # when addMachineSequence already compiled a valid topological order
+        if self.incremental and self._order_valid and not self._dirty:
+            mode = "incremental"
+            self._propagateHeads()
+            self._makespan = int((self.head + self.p).max(initial=0))
+            self._propagateTails()
+        else:
+            self._compile()
+            wide = len(self.operations) >= self.level_width * len(self._levels)
+            mode = "levels" if wide else "full"
+            heads = tails = len(self.operations)
+            self._forwardLevels() if wide else self._forward()
+            self._makespan = int((self.head + self.p).max(initial=0))
+            self._backwardLevels() if wide else self._backward()
+        self._head_dirty = set()
+        self._tail_dirty = set()
+        self._arc_changes = set()
+        self._p_changed = False
+        self._previous = previous
         self._computeCriticalPath()
         self._dirty = False
+        self.updates += 1
+        if self.instrumentation is not None:
+            self.instrumentation.update(mode, heads, tails, self._makespan, time.perf_counter() - start)
 
 
 class Shift(Jobshop):
-    def __init__(self):
-        super().__init__()
+    """
+    A class that schedules a jobshop with the shifting bottleneck procedure.
+
+    The single machine problems of the unscheduled machines in "computeLmax" are independent,
+    they can be solved by a pool of threads or processes. Only the (r, p, q) arrays of every
+    machine are sent to the workers, which return the Cmax and the sequence of the tasks. The
+    pool is created on first use and lives until "close" is called.
+
+    The sequences found for a (r, p, q) array are kept in a LRU cache, so the machines of
+    "reschedule" whose heads and tails did not change are not solved again. When a machine
+    has to be solved again, the Cmax of its last sequence under the new heads and tails is
+    used as the initial upper bound of Carlier.
+
+    With a time limit the procedure stops selecting bottlenecks when the time is up and
+    sequences the machines left with the Schrage sequence (the root node of Carlier), so it
+    always returns a complete schedule. The node and time limits of every Carlier call work
+    the same way. "optimal" tells if all the single machine problems were solved to optimality
+    and "timed_out" if the time limit stopped the procedure.
+
+    A machine sequence that would close a cycle raises a CycleError naming the machine when it
+    is inserted. With strict validation the final schedule is checked by "validate".
+
+    An Instrumentation (see instrument.py) gets an event for every bottleneck selection, every
+    reschedule pass, every update and every Carlier call, and for every Carlier node if it
+    asks for them.
+
+    Parameters
+    ----------
+    incremental: bool - Propagate heads and tails incrementally, see Jobshop
+    executor: str - "serial", "thread" or "process"
+    workers: int - Number of workers of the pool, None for the number of CPUs
+    cache_size: int - Number of sequences kept in the cache, 0 disables it
+    warm_start: bool - Start Carlier from the Cmax of the last sequence of the machine
+    time_limit: float - Wall-clock seconds of "shiftting_bottleneck", None for no limit
+    node_limit: int - Maximum number of nodes of every Carlier call, None for no limit
+    search: str - "depth" or "best" search of every Carlier call, see carlier.CarlierSolver
+    selection: bool - Immediate selections in every Carlier node, see carlier.CarlierSolver
+    machine_time_limit: float - Wall-clock seconds of every Carlier call, None for no limit
+    validation: str - "strict" to validate the final schedule, "skip" to trust it
+    instrumentation: Instrumentation - Receives the events of the procedure, None for no events
+    seed: int - Seed of the random tie-breaking between bottlenecks with the same Lmax, None to
+        keep the machine computeLmax returned last
+    screening: bool - Bound the Lmax of every machine first and only solve the machines that can
+        be the bottleneck with Carlier, see "screenLmax"
+
+    Attributes
+    ----------
+    screened: int - Number of single machine problems the screening did not solve
+    """
+
+    executors = {"serial": None, "thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+    def __init__(
+        self,
+        incremental=True,
+        executor="serial",
+        workers=None,
+        cache_size=4096,
+        warm_start=True,
+        time_limit=None,
+        node_limit=None,
+        search="depth",
+        selection=False,
+        machine_time_limit=None,
+        validation="strict",
+        instrumentation=None,
+        seed=None,
+        screening=False,
+    ):
+        super().__init__(incremental=incremental, instrumentation=instrumentation)
+        if executor not in self.executors:
+            raise ValueError("unknown executor {!r}, expected one of {}".format(executor, sorted(self.executors)))
+        if validation not in ("strict", "skip"):
+            raise ValueError("unknown validation {!r}, expected 'strict' or 'skip'".format(validation))
+        self.validation = validation
+        self.executor = executor
+        self.workers = workers
+        self._pool = None
+        self.cache = SequenceCache(cache_size)
+        self.warm_start = warm_start
+        # last sequence (task indices) solved for every machine
+        self._sequences = {}
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        if search not in carlier.CarlierSolver.searches:
+            raise ValueError("unknown search {!r}, expected one of {}".format(search, carlier.CarlierSolver.searches))
+        self.search = search
+        self.selection = selection
+        self.machine_time_limit = machine_time_limit
+        self._deadline = None
+        self.optimal = True
+        self.timed_out = False
+        self.iterations = 0
+        self.completed = False
+        self._random = None if seed is None else random.Random(seed)
+        self.screening = screening
+        self.screened = 0
         self.scheduled_machine_id = set()
         self.lateness_max = sys.maxsize
         self.node_sequence = None
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # shut down the worker pool, a new one is created if needed
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
     def output(self):
-        print("makespan: ", self.makespan)
+        print("makespan: ", self.makespan())
+        LF = self.LF.tolist()
         for i in self.machines:
+            ops = sorted(self.machines[i], key=self.key)
             print("Machine: " + str(i))
             s = "{0:<7s}".format("jobs:")
-            for ij in sorted(self.machines[i]):
-                if ij in ("U", "V"):
-                    continue
-                s += "{0:>5d}".format(ij[1])
+            for ij in ops:
+                s += "{0:>5d}".format(self.key(ij)[1])
             print(s)
             s = "{0:<7s}".format("p:")
-            for ij in sorted(self.machines[i]):
-                if ij in ("U", "V"):
-                    continue
-                s += "{0:>5d}".format(self.nodes[ij]["p"])
+            for ij in ops:
+                s += "{0:>5d}".format(int(self.p[ij]))
             print(s)
             s = "{0:<7s}".format("r:")
-            for ij in sorted(self.machines[i]):
-                if ij in ("U", "V"):
-                    continue
-                s += "{0:>5d}".format(self.nodes[ij]["ES"])
+            for ij in ops:
+                s += "{0:>5d}".format(int(self.head[ij]))
             print(s)
             s = "{0:<7s}".format("d:")
-            for ij in sorted(self.machines[i]):
-                if ij in ("U", "V"):
-                    continue
-                s += "{0:>5d}".format(self.nodes[ij]["LF"])
+            for ij in ops:
+                s += "{0:>5d}".format(LF[ij])
             print(s)
             print("\n")
 
+    def _timeUp(self):
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    def _machineTimeLimit(self):
+        # a Carlier call never runs past the time limit of the procedure
+        limits = [self.machine_time_limit]
+        if self._deadline is not None and not self._timeUp():
+            limits.append(max(0.0, self._deadline - time.perf_counter()))
+        elif self.timed_out:
+            limits.append(0.0)
+        return min((t for t in limits if t is not None), default=None)
+
     def shiftting_bottleneck(self):
-        all_machine = set(self.machines.keys())
-        need_schedule_machine = all_machine - self.scheduled_machine_id
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit
+        self._bottlenecks()
+        self._complete()
+        print("completed:", self.makespan())
+        return self.makespan()
+
+    def _bottlenecks(self, reschedule=None):
+        # fix the largest bottleneck until every machine is scheduled, reschedule: the machines
+        # reoptimized after every iteration, None for all the scheduled ones
+        self._refresh()  # the first bottleneck is chosen on up to date heads and tails
         lmax = sys.maxsize
-        while len(need_schedule_machine) > 0 and lmax > 0:
-            machine_schedule_result = self.computeLmax(need_schedule_machine)
-            sorted_lmax = sorted(machine_schedule_result.items(), key=lambda x: x[1][0])
-            machine = sorted_lmax[-1][0]  # machine with L{max}
-            lmax, node_seq = sorted_lmax[-1][1]  # the result of single machine problem
-            edges_seq = list(zip(node_seq[:-1], node_seq[1:]))  # generate the edges
-            assert len(set(node_seq)) == len(node_seq)
-            self.add_edges_from(edges_seq)  # add the edges of the machine
-            self.criticalPath()  # update the attribute with CPM
-            self.reschedule()  # reschedule all machines
-            self.scheduled_machine_id.add(machine)  # set the machine is completed
-            need_schedule_machine = all_machine - self.scheduled_machine_id
-            # print(f"Choose machine: {machine}, Choose seq: {seq}")
-        else:
-            remain_machine = all_machine - self.scheduled_machine_id
-            for m in remain_machine:
-                node_seq = machine_schedule_result[m][1]
-                edges_seq = list(zip(node_seq[:-1], node_seq[1:]))
-                self.add_edges_from(edges_seq)
-                # print(f"Choose machine: {m}, Choose seq: {seq}")
-            job_num = len(self.machines[0])
-            machine_num = len(all_machine)
-            node_num = job_num * machine_num + 2
-            edge_num = (job_num - 1) * machine_num + job_num * (machine_num + 1)
-            assert len(self.nodes) == node_num
-            assert len(self.edges) == edge_num
-            assert list(nx.simple_cycles(nx.DiGraph(self.edges))) == []
-            # nx.draw(self)
-            # plt.show()
-            print("completed:", self.makespan())
-
-    def reschedule(self):
-        for m in self.scheduled_machine_id:
+        while self._unscheduled() and lmax > 0 and not self._timeUp():
+            self.iterations += 1
+            start = time.perf_counter()
+            ranked = self._rankBottlenecks(self._lmax(1))
+            machine, (lmax, node_seq) = ranked[0]  # machine with L{max}
+            if self.instrumentation is not None:
+                elapsed = time.perf_counter() - start
+                self.instrumentation.selection(self.iterations, machine, lmax, len(node_seq), elapsed)
+            self._fixMachine(machine, node_seq, reschedule)
+
+    def insertJobs(self, jobs, passes=0):
+        """
+            insert jobs into the schedule: the machines of the new tasks are rescheduled with the
+            new tasks, one after the other, while the other machines keep their sequences. A machine
+            new to the schedule goes through the bottleneck loop
+        :param jobs: dictionary of Job, with ids not in the schedule
+        :param passes: number of reschedule passes over all the machines afterwards, 0 only re-solves
+            the affected machines
+        :return: the makespan of the new schedule
+        """
+        for j in jobs.values():
+            if j.Id in self._job_first:
+                raise ValueError("job {!r} is already in the schedule".format(j.Id))
+        affected = {m for j in jobs.values() for m in j.r}
+        for m in affected:
+            # the task indices of the machine change
+            self._sequences.pop(m, None)
+        self.addJobs(jobs)
+        return self._replan(affected, passes)
+
+    def removeJobs(self, job_ids, passes=0):
+        """
+            remove jobs from the schedule: every machine keeps the order of its other tasks, then
+            the machines of the removed tasks are rescheduled
+        :param job_ids:
+        :param passes: number of reschedule passes over all the machines afterwards, 0 only re-solves
+            the affected machines
+        :return: the makespan of the new schedule
+        """
+        job_ids = set(job_ids)
+        ops = []
+        for j in job_ids:
+            if j not in self._job_first:
+                raise ValueError("unknown job {!r}".format(j))
+            first, n = self._job_first[j]
+            ops.extend(range(first, first + n))
+        affected = set(self.op_machine[ops].tolist())
+        removed = set(ops)
+        sequences = {}
+        for m in affected & self.scheduled_machine_id:
+            # the order of the tasks left, a chain through the removed ones closes no cycle
+            sequences[m] = [i for i in self.machines[m].sequence() if i not in removed]
+            self._sequences.pop(m, None)
+        new_id = super().removeJobs(job_ids).tolist()
+        for m, seq in sequences.items():
+            seq = [new_id[i] for i in seq]
+            self.add_edges_from(zip(seq[:-1], seq[1:]))
+        # a machine without tasks left is gone
+        self.scheduled_machine_id &= set(self.machines)
+        return self._replan(affected & self.scheduled_machine_id, passes)
+
+    def warmStart(self, sequences):
+        """
+            take the sequences of a known schedule of the jobs (e.g. from a SolutionStore) as the
+            last sequences of the machines, so their Cmax under the current heads and tails are the
+            initial upper bounds of Carlier and are kept when Carlier finds nothing better
+        :param sequences: {machine id: [job ids in processing order]}, see machineSequences
+        :return:
+        """
+        job = self.operations["job"]
+        for m, seq in sequences.items():
+            machine = self.machines.get(m)
+            if machine is None or sorted(seq) != sorted(job[machine.ops].tolist()):
+                raise ValueError("the sequence of machine {!r} does not match its tasks".format(m))
+            index = {j: k for k, j in enumerate(job[machine.ops].tolist())}
+            self._sequences[m] = [index[j] for j in seq]
+
+    def _replan(self, affected, passes):
+        # reschedule the affected machines, schedule the ones left unscheduled, then reschedule all
+        # the machines "passes" times
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit
+        self.timed_out = False
+        self.completed = False
+        self._refresh()
+        self.reschedule(affected & self.scheduled_machine_id)
+        self._bottlenecks(affected)
+        for _ in range(passes):
+            self.reschedule()
+        self._complete()
+        return self.makespan()
+
+    def beam(self, width=4, branching=2):
+        """
+            the shifting bottleneck procedure as a beam search: every schedule of the beam is
+            continued with each of its "branching" largest bottlenecks, and the "width" partial
+            schedules with the smallest makespan are kept for the next iteration, along with the
+            schedule of the plain procedure (the largest bottleneck every time). The best
+            complete schedule is adopted by this Shift. The schedules of an iteration are expanded
+            in the pool of the executor, a process pool sends them to the workers by pickling.
+            The ties of the makespans are broken by the order of the bottlenecks, so the result
+            only depends on the seed. width=1 and branching=1 is "shiftting_bottleneck".
+        :param width: number of partial schedules kept in every iteration
+        :param branching: number of bottlenecks tried for every partial schedule
+        :return: the makespan of the best schedule
+        """
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit
+        self._refresh()
+        root = self._copy()
+        root.executor = "serial"  # the beam is parallel, the states are not
+        states = [root]
+        best = None
+        if not root._unscheduled() or root._timeUp():
+            root._complete()
+            states, best = [], root
+        while states:
+            if self.executor == "serial" or len(states) < 2:
+                expanded = [_beamExpand(state, branching) for state in states]
+            else:
+                if self._pool is None:
+                    self._pool = self.executors[self.executor](max_workers=self.workers)
+                expanded = list(self._pool.map(_beamExpand, states, [branching] * len(states)))
+            children = [child for children in expanded for child in children]
+            for child in children:
+                if child.completed and (best is None or child.makespan() < best.makespan()):
+                    best = child
+            # the first state continues the plain procedure, so the beam never ends worse than it;
+            # sorted is stable: equal makespans keep the order of their bottleneck ranks
+            states = [c for c in children if not c.completed]
+            if states and states[0] is children[0]:
+                states = states[:1] + sorted(states[1:], key=Jobshop.makespan)[: width - 1]
+            else:
+                states = sorted(states, key=Jobshop.makespan)[:width]
+        self._adopt(best)
+        print("completed:", self.makespan())
+        return self.makespan()
+
+    # attributes a copy of the Shift shares with it instead of copying them
+    _shared = ("_pool", "instrumentation", "cache")
+
+    def _copy(self):
+        # a deep copy of the schedule, the pool, the instrumentation and the cache are shared
+        return copy.deepcopy(self)
+
+    def __deepcopy__(self, memo):
+        # __getstate__ is for pickling only, a deep copy keeps the shared attributes
+        clone = object.__new__(type(self))
+        memo[id(self)] = clone
+        for k, v in self.__dict__.items():
+            clone.__dict__[k] = v if k in self._shared else copy.deepcopy(v, memo)
+        return clone
+
+    def _adopt(self, state):
+        # take over the schedule of a beam state, the settings of this Shift are kept
+        keep = {k: self.__dict__[k] for k in ("_pool", "instrumentation", "executor", "cache", "_deadline")}
+        self.__dict__.update(state.__dict__)
+        self.__dict__.update(keep)
+        for machine in self.machines.values():
+            machine.shop = self
+        self.op_key = OperationKeys(self)
+        self.op_id = OperationIds(self)
+
+    def __getstate__(self):
+        # pickling (e.g. for a process pool): the pool and the instrumentation stay in the process
+        # of the Shift, the cache is not sent
+        state = dict(self.__dict__)
+        state["_pool"] = None
+        state["instrumentation"] = None
+        state["cache"] = SequenceCache(self.cache.maxsize)
+        return state
+
+    def _unscheduled(self):
+        # in the order of the ids, a set would iterate differently in a copy of the Shift
+        return [m for m in sorted(self.machines) if m not in self.scheduled_machine_id]
+
+    def _lmax(self, count):
+        # the Lmax of the unscheduled machines, of the "count" largest ones only when screening
+        if self.screening:
+            return self.screenLmax(self._unscheduled(), count)
+        return self.computeLmax(self._unscheduled())
+
+    def _rankBottlenecks(self, result):
+        # (machine, (lateness, node_seq)) by decreasing lateness; without a seed the ties go to
+        # the machine computeLmax returned last, with a seed they are drawn at random
+        items = list(result.items())
+        if self._random is None:
+            return sorted(items, key=lambda x: x[1][0])[::-1]
+        keys = [(x[1][0], self._random.random()) for x in items]
+        return [x for _, x in sorted(zip(keys, items), key=lambda kx: kx[0], reverse=True)]
+
+    def _fixMachine(self, machine, node_seq, reschedule=None):
+        # one iteration of the procedure with the sequence of the chosen bottleneck
+        assert len(set(node_seq)) == len(node_seq)
+        self.addMachineSequence(machine, node_seq)  # add the edges of the machine
+        self._refresh()  # update the attribute with CPM
+        self.reschedule(reschedule)  # reschedule all machines, or the given ones
+        self.scheduled_machine_id.add(machine)  # set the machine is completed
+
+    def _complete(self):
+        # sequence the machines left with Carlier and check the schedule
+        for m in self._unscheduled():
+            self._refresh()
+            node_seq = self.singleMachineCarlier(self.machines[m])[1]
+            self.addMachineSequence(m, node_seq)
+            self.scheduled_machine_id.add(m)
+        if self.validation == "strict":
+            self.validate()
+        self.completed = True
+
+    def reschedule(self, machines=None):
+        # machines: the scheduled machines to reschedule, None for all of them
+        start = time.perf_counter()
+        count = 0
+        for m in sorted(self.scheduled_machine_id if machines is None else machines & self.scheduled_machine_id):
+            if self._timeUp():
+                # keep the current sequences of the machines left
+                break
+            count += 1
             self.remove_edges_from(list(self.machines[m].edges))
+            self._refresh()
             lateness, node_seq = self.singleMachineCarlier(self.machines[m])
             # lateness, node_seq = self.singleMachinePermutation(self.machines[m])
-            edges_seq = list(zip(node_seq[:-1], node_seq[1:]))  # generate the edges
-            self.add_edges_from(edges_seq)  # add the edges of the machine
-            self.criticalPath()
+            self.addMachineSequence(m, node_seq)  # add the edges of the machine
+            self._refresh()
+        if self.instrumentation is not None:
+            self.instrumentation.reschedule(self.iterations, count, time.perf_counter() - start)
 
     def singleMachineCarlier(self, machine):
-        # list(nx.simple_cycles(nx.DiGraph(self.edges)))
-        tasks = []
-        nodes = []
-        for j in machine:
-            if str(j) != "U" and str(j) != "V":
-                tasks.append(
-                    [
-                        self.nodes[j]["ES"],
-                        self.nodes[j]["p"],
-                        self._makespan - self.nodes[j]["LF"],  # tail time
-                    ]
-                )
-                nodes.append(j)
-        # tasks = np.array(tasks)
-        carlier.UB = 9999999
-        LB, UB, seq = carlier.Carlier_Elim(tasks)
-        node_seq = [nodes[j] for j in seq]
-        due = [self.nodes[j]["LF"] for j in node_seq]
-        finish = [0] * len(node_seq)
-        for i, j in enumerate(node_seq):
-            finish[i] = max(finish[i - 1], self.nodes[j]["ES"]) + self.nodes[j]["p"]
-        late = max([f - d for d, f in zip(due, finish)])
+        seq = self._solveMachines([machine])[0]
+        return self._machineResult(machine, seq)
+
+    def _solveMachines(self, machines):
+        # solve the single machine problems of the machines, in the pool if there is one,
+        # and return the sequences as task indices
+        tasks = [self._machineTasks(machine) for machine in machines]
+        seqs = [self.cache.get(t) for t in tasks]
+        todo = [i for i, seq in enumerate(seqs) if seq is None]
+        bounds = [self._upperBound(machines[i], tasks[i]) for i in todo]
+        limit = self._machineTimeLimit()
+        args = [[tasks[i] for i in todo], bounds, [self.node_limit] * len(todo), [limit] * len(todo)]
+        serial = self.executor == "serial" or len(todo) < 2
+        if self.instrumentation is not None and self.instrumentation.nodes and (serial or self.executor == "thread"):
+            args.append([self._nodeListener(machines[i].Id) for i in todo])
+        solve = functools.partial(carlier.Carlier_np, search=self.search, selection=self.selection)
+        if serial:
+            results = map(solve, *args)
+        else:
+            if self._pool is None:
+                self._pool = self.executors[self.executor](max_workers=self.workers)
+            results = self._pool.map(solve, *args)
+        for i, (UB, seq, optimal, nodes, elapsed) in zip(todo, results):
+            if self.instrumentation is not None:
+                self.instrumentation.carlier(machines[i].Id, len(tasks[i]), UB, nodes, optimal, elapsed)
+            if seq is None:
+                # nothing beat the last sequence of the machine
+                seq = self._sequences[machines[i].Id]
+            if optimal:
+                self.cache.put(tasks[i], seq)
+            self.optimal = self.optimal and optimal
+            seqs[i] = seq
+        for machine, seq in zip(machines, seqs):
+            self._sequences[machine.Id] = seq
+        return seqs
+
+    def _nodeListener(self, m):
+        # the node events of the Carlier call of machine m
+        instrumentation = self.instrumentation
+
+        def listener(node, U, LB, elapsed):
+            instrumentation.node(m, node, U, LB, elapsed)
+
+        return listener
+
+    def _upperBound(self, machine, tasks):
+        # the last sequence of the machine is still feasible, its Cmax bounds the new problem;
+        # one more than it keeps the sequence Carlier would find without the bound
+        seq = self._sequences.get(machine.Id)
+        if not self.warm_start or seq is None:
+            return sys.maxsize
+        return carlier.sequence_Cmax(tasks.tolist(), seq) + 1
+
+    def _machineTasks(self, machine):
+        # the heads and tails are read as they are, the caller decides when to update them
+        # tail time = makespan - LF
+        return np.column_stack((self.head[machine.ops], self.p[machine.ops], self.tail[machine.ops]))
+
+    def _machineResult(self, machine, seq):
+        # map the task indices back to operation ids
+        ops = machine.ops.tolist()
+        node_seq = [ops[j] for j in seq]
+        late = self._lateness(node_seq)
         return late, node_seq
 
+    def _lateness(self, node_seq):
+        # maximum lateness of a machine sequence w.r.t. the heads and due dates (LF)
+        rows = self.operations[list(node_seq)]
+        finish = 0
+        late = -sys.maxsize
+        for r, p, q in zip(rows["head"].tolist(), rows["p"].tolist(), rows["tail"].tolist()):
+            finish = max(finish, r) + p
+            late = max(late, finish - (self._makespan - q))
+        return late
+
     def singleMachinePermutation(self, machine):
         # 1 r_j L_max
         # direct permutation
         lateness = {}
         for seq in permutations(machine):
-            release = [self.nodes[j]["ES"] for j in seq]
-            due = [self.nodes[j]["LF"] for j in seq]
-            finish = [0] * len(release)
-            for i, j in enumerate(seq):
-                finish[i] = max(finish[i - 1], release[i]) + self.nodes[j]["p"]
-            late = max([f - d for d, f in zip(due, finish)])
-            lateness[seq] = late
+            lateness[seq] = self._lateness(seq)
         node_seq, late = argmin_kv(lateness)
         return late, node_seq
 
     def computeLmax(self, need_schedule_machine):
         result_dict = {}  # {machine_id: (lateness, node_seq)}
-        for m in need_schedule_machine:
-            # lateness, seq = self.singleMachinePermutation(self.machines[m])
-            lateness, seq = self.singleMachineCarlier(self.machines[m])
-            # print("Machine: {}, lateness: {}, optimal seq: {}".format(m, lateness, seq))
-            # machine_lateness_seq[m] = (lateness, seq)
-            result_dict[m] = (lateness, seq)
+        machines = [self.machines[m] for m in need_schedule_machine]
+        for machine, seq in zip(machines, self._solveMachines(machines)):
+            # lateness, seq = self.singleMachinePermutation(machine)
+            lateness, seq = self._machineResult(machine, seq)
+            result_dict[machine.Id] = (lateness, seq)
         return result_dict
 
-    def computeLmaxEDD(self):
-        for m in self.machines:
-            lateness = {}
-            ix_due_dict = {}
-            for j in self.machines[m]:
-                ix_due_dict[j] = self.nodes[j]["LF"]
-            # EDD Rule
-            ix_due_item = sorted(ix_due_dict.items(), key=lambda x: x[1])
-            seq = [item[0] for item in ix_due_item]
-            release = [self.nodes[j]["ES"] for j in seq]
-            due = [self.nodes[j]["LF"] for j in seq]
-            finish = [0] * len(release)
-            for i, j in enumerate(seq):
-                finish[i] = max(finish[i - 1], release[i]) + self.nodes[j]["p"]
-            late = max([f - d for d, f in zip(due, finish)])
-            # print("Machine: {}, lateness: {}, optimal seq: {}".format(m, late, seq))
-            # machine_lateness_seq[m] = (l, s)
-            self.machines[m].lateness_max = late
-            self.machines[m].node_sequence = seq
+    def computeLmaxEDD(self, need_schedule_machine):
+        """
+            the EDD sequence (increasing due dates LF, i.e. decreasing tails) of every machine and its
+            lateness, an upper bound of the Lmax of the machine; all the machines are done in one
+            vectorized pass
+        :param need_schedule_machine: machine ids
+        :return: {machine_id: (lateness, node_seq)}
+        """
+        machines = [self.machines[m] for m in need_schedule_machine]
+        if not machines:
+            return {}
+        sizes = [len(machine) for machine in machines]
+        seg = np.repeat(np.arange(len(machines)), sizes)
+        ops = np.concatenate([machine.ops for machine in machines])
+        ops = ops[np.lexsort((-self.tail[ops], seg))]
+        r, p, q = self.head[ops], self.p[ops], self.tail[ops]
+        # the k-th task of a machine ends at max(r_i + p_i + ... + p_k) over the tasks i <= k, a running
+        # maximum of r_i - (p of the tasks before i), shifted per machine so every machine starts over
+        done = np.cumsum(p)
+        shift = seg * (int(done[-1]) + int(r.max()) + 1)
+        finish = done + np.maximum.accumulate(r - done + p + shift) - shift
+        first = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        late = np.maximum.reduceat(finish + q - self._makespan, first).tolist()
+        seqs = np.split(ops, first[1:])
+        return {machine.Id: (late[k], seqs[k].tolist()) for k, machine in enumerate(machines)}
+
+    def screenLmax(self, need_schedule_machine, count=1):
+        """
+            computeLmax for the "count" machines with the largest Lmax only: the Lmax of every machine
+            is bounded from below by preemptive Schrage and from above by Schrage and EDD, and Carlier
+            is only run, in decreasing order of the upper bounds, on the machines whose upper bound
+            reaches the count-th largest Lmax known. A machine whose bounds meet needs no Carlier
+        :param need_schedule_machine: machine ids
+        :param count: number of bottlenecks needed, e.g. the branching of the beam
+        :return: {machine_id: (lateness, node_seq)} of the machines solved, in the order of the ids
+        """
+        edd = self.computeLmaxEDD(need_schedule_machine)
+        bounds = {}
+        for m in need_schedule_machine:
+            machine = self.machines[m]
+            tasks = self._machineTasks(machine)
+            teta, Cmax = carlier.Schrage_np(tasks)
+            upper, seq = min((Cmax - self._makespan, machine.ops[teta].tolist()), edd[m])
+            bounds[m] = (carlier.Schrage_pmtn_np(tasks) - self._makespan, upper, seq)
+        lower = sorted(lb for lb, _, _ in bounds.values())[-min(count, len(bounds))] if bounds else 0
+        candidates = sorted((m for m in bounds if bounds[m][1] >= lower), key=lambda m: -bounds[m][1])
+        # one machine at a time prunes the most, a pool gets all the candidates at once
+        batch = 1 if self.executor == "serial" else len(candidates)
+        found = {}
+        for k in range(0, len(candidates), batch):
+            if len(found) >= count:
+                best = sorted(late for late, _ in found.values())[-count]
+                chunk = [m for m in candidates[k : k + batch] if bounds[m][1] >= best]
+                if not chunk:
+                    break
+            else:
+                chunk = candidates[k : k + batch]
+            exact = [m for m in chunk if bounds[m][0] == bounds[m][1]]
+            for m in exact:
+                found[m] = bounds[m][1:]
+            solve = [self.machines[m] for m in chunk if m not in exact]
+            for machine, seq in zip(solve, self._solveMachines(solve)):
+                found[machine.Id] = self._machineResult(machine, seq)
+        self.screened += len(need_schedule_machine) - len(found)
+        return {m: found[m] for m in need_schedule_machine if m in found}
+
+
+def _beamExpand(state, branching):
+    # the children of a beam state, one for each of its largest bottlenecks
+    state.iterations += 1
+    ranked = state._rankBottlenecks(state._lmax(branching))
+    children = []
+    for machine, (lmax, node_seq) in ranked[:branching]:
+        child = state._copy()
+        child._fixMachine(machine, node_seq)
+        if lmax <= 0 or not child._unscheduled() or child._timeUp():
+            child._complete()
+        children.append(child)
+    return children
@@ -159,3 +159,139 @@ ta_dataset = [
     "ta79",
     "ta80",
 ]
+
+# best known makespans (upper bounds) from the literature, instances without an entry get no gap
+best_known = {
+    "abz5": 1234,
+    "abz6": 943,
+    "abz7": 656,
+    "abz8": 648,
+    "abz9": 678,
+    "ft06": 55,
+    "ft10": 930,
+    "ft20": 1165,
+    "la01": 666,
+    "la02": 655,
+    "la03": 597,
+    "la04": 590,
+    "la05": 593,
+    "la06": 926,
+    "la07": 890,
+    "la08": 863,
+    "la09": 951,
+    "la10": 958,
+    "la11": 1222,
+    "la12": 1039,
+    "la13": 1150,
+    "la14": 1292,
+    "la15": 1207,
+    "la16": 945,
+    "la17": 784,
+    "la18": 848,
+    "la19": 842,
+    "la20": 902,
+    "la21": 1046,
+    "la22": 927,
+    "la23": 1032,
+    "la24": 935,
+    "la25": 977,
+    "la26": 1218,
+    "la27": 1235,
+    "la28": 1216,
+    "la29": 1152,
+    "la30": 1355,
+    "la31": 1784,
+    "la32": 1850,
+    "la33": 1719,
+    "la34": 1721,
+    "la35": 1888,
+    "la36": 1268,
+    "la37": 1397,
+    "la38": 1196,
+    "la39": 1233,
+    "la40": 1222,
+    "orb01": 1059,
+    "orb02": 888,
+    "orb03": 1005,
+    "orb04": 1005,
+    "orb05": 887,
+    "orb06": 1010,
+    "orb07": 397,
+    "orb08": 899,
+    "orb09": 934,
+    "orb10": 944,
+    "swv01": 1407,
+    "swv02": 1475,
+    "swv03": 1398,
+    "swv04": 1464,
+    "swv05": 1424,
+    "swv06": 1667,
+    "swv07": 1594,
+    "swv08": 1751,
+    "swv09": 1655,
+    "swv10": 1743,
+    "swv11": 2983,
+    "swv12": 2972,
+    "swv13": 3104,
+    "swv14": 2968,
+    "swv15": 2885,
+    "swv16": 2924,
+    "swv17": 2794,
+    "swv18": 2852,
+    "swv19": 2843,
+    "swv20": 2823,
+    "ta01": 1231,
+    "ta02": 1244,
+    "ta03": 1218,
+    "ta04": 1175,
+    "ta05": 1224,
+    "ta06": 1238,
+    "ta07": 1227,
+    "ta08": 1217,
+    "ta09": 1274,
+    "ta10": 1241,
+    "ta11": 1357,
+    "ta12": 1367,
+    "ta13": 1342,
+    "ta14": 1345,
+    "ta15": 1339,
+    "ta16": 1360,
+    "ta17": 1462,
+    "ta18": 1396,
+    "ta19": 1332,
+    "ta20": 1348,
+    "ta51": 2760,
+    "ta52": 2756,
+    "ta53": 2717,
+    "ta54": 2839,
+    "ta55": 2679,
+    "ta56": 2781,
+    "ta57": 2943,
+    "ta58": 2885,
+    "ta59": 2655,
+    "ta60": 2723,
+    "ta61": 2868,
+    "ta62": 2869,
+    "ta63": 2755,
+    "ta64": 2702,
+    "ta65": 2725,
+    "ta66": 2845,
+    "ta67": 2825,
+    "ta68": 2784,
+    "ta69": 3071,
+    "ta70": 2995,
+    "ta71": 5464,
+    "ta72": 5181,
+    "ta73": 5568,
+    "ta74": 5339,
+    "ta75": 5392,
+    "ta76": 5342,
+    "ta77": 5436,
+    "ta78": 5394,
+    "ta79": 5358,
+    "ta80": 5183,
+    "yn1": 884,
+    "yn2": 904,
+    "yn3": 892,
+    "yn4": 968,
+}
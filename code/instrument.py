@@ -0,0 +1,138 @@
+"""
+Instrumentation of the shifting bottleneck procedure.
+
+An Instrumentation object passed to Shift (or Jobshop) gets an event for every bottleneck
+selection, every reschedule pass, every update of the heads and tails, every single machine
+problem solved by Carlier and, optionally, every node of the branch and bound. Every event
+counts and times its kind and is written as one JSON line to the trace file, if there is one.
+Without an Instrumentation the hooks are a single "is not None" test.
+
+The node events are only sent by Carlier calls running in the process of the Shift (the
+"serial" and "thread" executors), the "carlier" events of a process pool still hold the
+number of nodes of every call.
+
+"profile" runs a block under cProfile or pyinstrument.
+"""
+import contextlib
+import cProfile
+import json
+import threading
+import time
+from collections import defaultdict
+
+
+class Instrumentation(object):
+    """
+    A class that collects the events of a Shift.
+
+    Parameters
+    ----------
+    trace: str or file - JSONL file every event is written to, None to only count them
+    nodes: bool - Send an event for every node of the Carlier branch and bound
+
+    Attributes
+    ----------
+    counts: dict - Number of events of every kind
+    time: dict - Seconds spent in the events of every kind
+    """
+
+    def __init__(self, trace=None, nodes=False):
+        self.nodes = nodes
+        self.counts = defaultdict(int)
+        self.time = defaultdict(float)
+        self._own_file = isinstance(trace, str)
+        self._file = open(trace, "w") if self._own_file else trace
+        self._start = time.perf_counter()
+        # the events of a thread pool come from several threads
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            if self._own_file:
+                self._file.close()
+            else:
+                self._file.flush()
+            self._file = None
+
+    def event(self, kind, elapsed, **fields):
+        """
+            record an event
+        :param kind: e.g. "selection", "reschedule", "update", "carlier" or "node"
+        :param elapsed: seconds spent in the event
+        :param fields: written to the trace with the event
+        :return:
+        """
+        with self._lock:
+            self.counts[kind] += 1
+            self.time[kind] += elapsed
+            if self._file is not None:
+                fields.update(event=kind, t=round(time.perf_counter() - self._start, 6), elapsed=round(elapsed, 6))
+                self._file.write(json.dumps(fields) + "\n")
+
+    def selection(self, iteration, machine, lmax, size, elapsed):
+        # the bottleneck machine of an iteration, elapsed covers computeLmax
+        self.event("selection", elapsed, iteration=iteration, machine=machine, lmax=lmax, size=size)
+
+    def reschedule(self, iteration, machines, elapsed):
+        self.event("reschedule", elapsed, iteration=iteration, machines=machines)
+
+    def update(self, mode, heads, tails, makespan, elapsed):
+        # mode: "incremental", "levels", "full" or "restore" (the timing before the last update was swapped back)
+        # heads/tails: operations the update started from, all of them for a full update
+        self.event("update", elapsed, mode=mode, heads=heads, tails=tails, makespan=makespan)
+
+    def carlier(self, machine, size, Cmax, nodes, optimal, elapsed):
+        self.event("carlier", elapsed, machine=machine, size=size, cmax=Cmax, nodes=nodes, optimal=optimal)
+
+    def node(self, machine, node, U, LB, elapsed):
+        # U: Schrage Cmax of the node, LB: preemptive bound, None if the node has no critical task
+        self.event("node", elapsed, machine=machine, node=node, schrage=U, lb=LB)
+
+    def summary(self):
+        """
+            the number of events and seconds of every kind
+        :return:
+        """
+        return {kind: {"count": self.counts[kind], "time": round(self.time[kind], 6)} for kind in self.counts}
+
+
+@contextlib.contextmanager
+def profile(filename=None, profiler="cprofile"):
+    """
+        run the block under a profiler, e.g. "with profile('shift.prof'): js.shiftting_bottleneck()"
+    :param filename: the cProfile stats (for pstats or snakeviz) or the pyinstrument HTML report,
+        None to only keep the profiler
+    :param profiler: "cprofile" or "pyinstrument"
+    :return: yields the cProfile.Profile or pyinstrument.Profiler
+    """
+    if profiler == "cprofile":
+        p = cProfile.Profile()
+        p.enable()
+        try:
+            yield p
+        finally:
+            p.disable()
+            if filename is not None:
+                p.dump_stats(filename)
+    elif profiler == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ImportError("the pyinstrument profiler needs the pyinstrument package (pip install pyinstrument)")
+        p = pyinstrument.Profiler()
+        p.start()
+        try:
+            yield p
+        finally:
+            p.stop()
+            if filename is not None:
+                with open(filename, "w") as f:
+                    f.write(p.output_html())
+    else:
+        raise ValueError("unknown profiler {!r}, expected 'cprofile' or 'pyinstrument'".format(profiler))
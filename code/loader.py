@@ -0,0 +1,108 @@
+"""
+Readers for the instance files straight into NumPy arrays.
+
+Two formats are read:
+
+* jobshop instances (instances/): optional "#" comment lines, a line "jobs machines" and then
+  one line per job with the (machine, processing time) pairs of its route;
+* single machine instances (data/SCHRAGE*.DAT): a line with the number of tasks, optionally
+  followed by the number of columns, and then one line "r p q" per task.
+
+The parsed arrays are cached in a ".npy" file in the "__npycache__" directory next to the text
+file, so the instance directories only hold instances. The cache is used as long as it is not
+older than the text file and is opened memory-mapped, so repeated runs skip the text parsing.
+"""
+import os
+
+import numpy as np
+
+
+cache_dir = "__npycache__"
+
+
+def cache_file(filename):
+    head, tail = os.path.split(filename)
+    return os.path.join(head, cache_dir, tail + ".npy")
+
+
+def _load_cache(filename):
+    cached = cache_file(filename)
+    try:
+        if os.path.getmtime(cached) >= os.path.getmtime(filename):
+            return np.load(cached, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _save_cache(filename, array):
+    # write to a temporary file first, so a concurrent reader never sees a partial cache
+    cached = cache_file(filename)
+    tmp = "{}.{}.tmp".format(cached, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, cached)
+    except OSError:
+        # e.g. a read-only instance directory, the cache is only an optimization
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_numbers(filename):
+    # the numbers of the first line and of the rest of the file, comment lines are skipped
+    with open(filename, "r") as f:
+        lines = [line for line in f if not line.lstrip().startswith("#")]
+    if not lines:
+        raise ValueError("{}: empty file".format(filename))
+    header = [int(v) for v in lines[0].split()]
+    return header, np.array("".join(lines[1:]).split(), dtype=np.int64)
+
+
+def parse_jobshop(filename):
+    (job_num, machine_num), values = _read_numbers(filename)
+    if len(values) < 2 * job_num * machine_num:
+        raise ValueError("{}: expected {} jobs of {} tasks".format(filename, job_num, machine_num))
+    pairs = values[: 2 * job_num * machine_num].reshape(job_num, machine_num, 2)
+    # routes and processing times stacked in one (2, jobs, machines) array
+    return np.ascontiguousarray(pairs.transpose(2, 0, 1))
+
+
+def parse_schrage(filename):
+    # the header holds the number of tasks, older files also hold the number of columns
+    header, values = _read_numbers(filename)
+    task_num = header[0]
+    if len(values) != 3 * task_num:
+        raise ValueError("{}: expected {} tasks of 3 values, got {} values".format(filename, task_num, len(values)))
+    return values.reshape(task_num, 3)
+
+
+def read_jobshop(filename, cache=True):
+    """
+        read a jobshop instance
+    :param filename:
+    :param cache: use and write the ".npy" cache next to the file
+    :return: routes and processing times, two (jobs, machines) arrays
+    """
+    data = _load_cache(filename) if cache else None
+    if data is None:
+        data = parse_jobshop(filename)
+        if cache:
+            _save_cache(filename, data)
+    return data[0], data[1]
+
+
+def read_schrage(filename, cache=True):
+    """
+        read a single machine instance
+    :param filename:
+    :param cache: use and write the ".npy" cache next to the file
+    :return: (tasks, 3) array of release, processing and tail times
+    """
+    data = _load_cache(filename) if cache else None
+    if data is None:
+        data = parse_schrage(filename)
+        if cache:
+            _save_cache(filename, data)
+    return data
@@ -0,0 +1,246 @@
+"""
+Tabu search on the critical path of a complete schedule, e.g. the one of the shifting bottleneck.
+
+Every iteration takes one critical path of the schedule and splits it into blocks, the runs of
+consecutive tasks of the path processed on the same machine. The moves reorder a block:
+
+* N5 (Nowicki and Smutnicki, 1996): swap the first two or the last two tasks of a block, only
+  the last two of the first block and only the first two of the last block;
+* N7 (Zhang et al., 2007): move an inner task of a block to its front or back, and move the first
+  (last) task of a block behind (in front of) every other task of it.
+
+A move is never evaluated with a full update of the graph. Its makespan is estimated from the
+current heads and tails: the heads of the reordered tasks are recomputed from the machine and
+job predecessors in the new order, their tails from the successors, and the estimate is the
+longest path through them. Only the chosen move goes through the (incremental) update of the
+Jobshop. The moves of N7 that could close a cycle are filtered out with the conditions of Balas
+and Vazacopoulos (1998).
+
+The reversed pairs of tasks of a move are tabu for "tenure" iterations, unless the estimate beats
+the best makespan. The best schedule found is restored at the end.
+"""
+import time
+
+from classes import CycleError, ScheduleError
+
+neighborhoods = ("N5", "N7")
+
+
+def critical_blocks(seqs, pos, machine, head, tail, p, job_prev, makespan):
+    """
+        the blocks of one critical path
+    :param seqs: sequence of every machine
+    :param pos: position of every task in the sequence of its machine
+    :param machine: machine of every task
+    :param head:
+    :param tail:
+    :param p:
+    :param job_prev: previous task of every task in its job, -1 for none
+    :param makespan:
+    :return: (machine, first position, last position) of the blocks in the order of the path
+    """
+    u = next(i for i in range(len(head)) if head[i] + p[i] == makespan and tail[i] == 0)
+    blocks = []
+    m, last = machine[u], pos[u]
+    while True:
+        # follow the machine predecessor first, so the blocks are as long as possible
+        k = pos[u]
+        mp = seqs[machine[u]][k - 1] if k > 0 else -1
+        jp = job_prev[u]
+        if mp >= 0 and head[mp] + p[mp] == head[u]:
+            u = mp
+            continue
+        blocks.append((m, pos[u], last))
+        if jp >= 0 and head[jp] + p[jp] == head[u]:
+            u = jp
+            m, last = machine[u], pos[u]
+        else:
+            break
+    blocks.reverse()
+    return blocks
+
+
+def _moves_n5(blocks, seqs):
+    moves = []
+    for b, (m, i, j) in enumerate(blocks):
+        if j == i:
+            continue
+        seq = seqs[m]
+        if b > 0:
+            moves.append((m, i, i + 1, [seq[i + 1], seq[i]]))
+        if b < len(blocks) - 1 and (j - 1 != i or b == 0):
+            moves.append((m, j - 1, j, [seq[j], seq[j - 1]]))
+    return moves
+
+
+def _moves_n7(blocks, seqs, head, tail, p, job_prev, job_next):
+    moves = []
+    for m, i, j in blocks:
+        if j == i:
+            continue
+        seq = seqs[m]
+        block = seq[i : j + 1]
+        for k in range(i + 1, j + 1):
+            # the first task behind the task at k
+            u, v = block[0], seq[k]
+            if _forward_ok(u, v, tail, p, job_next):
+                moves.append((m, i, k, block[1 : k - i + 1] + [u]))
+        for k in range(i, j):
+            # the last task in front of the task at k
+            u, v = block[-1], seq[k]
+            if _backward_ok(u, v, head, p, job_prev):
+                moves.append((m, k, j, [u] + block[k - i : -1]))
+        for k in range(i + 1, j):
+            # an inner task to the front or the back of the block
+            u = seq[k]
+            if _backward_ok(u, block[0], head, p, job_prev):
+                moves.append((m, i, k, [u] + block[: k - i]))
+            if _forward_ok(u, block[-1], tail, p, job_next):
+                moves.append((m, k, j, block[k - i + 1 :] + [u]))
+    return moves
+
+
+def _forward_ok(u, v, tail, p, job_next):
+    # moving u right behind v can only close a cycle through the job successor of u, there is
+    # none if the tail of v is no shorter than the one of the job successor
+    js = job_next[u]
+    return js < 0 or tail[v] + p[v] >= tail[js] + p[js]
+
+
+def _backward_ok(u, v, head, p, job_prev):
+    # moving u right in front of v can only close a cycle through the job predecessor of u, there
+    # is none if v ends no earlier than the job predecessor
+    jp = job_prev[u]
+    return jp < 0 or head[v] + p[v] >= head[jp] + p[jp]
+
+
+def estimate(move, seqs, head, tail, p, job_prev, job_next):
+    """
+        the estimated makespan after a move
+    :param move: (machine, first position, last position, new order of the tasks between them)
+    :param seqs:
+    :param head:
+    :param tail:
+    :param p:
+    :param job_prev:
+    :param job_next:
+    :return:
+    """
+    m, i, j, segment = move
+    seq = seqs[m]
+    t = head[seq[i - 1]] + p[seq[i - 1]] if i > 0 else 0
+    heads = []
+    for u in segment:
+        jp = job_prev[u]
+        if jp >= 0 and head[jp] + p[jp] > t:
+            t = head[jp] + p[jp]
+        heads.append(t)
+        t += p[u]
+    t = tail[seq[j + 1]] + p[seq[j + 1]] if j + 1 < len(seq) else 0
+    longest = 0
+    for u, h in zip(reversed(segment), reversed(heads)):
+        js = job_next[u]
+        if js >= 0 and tail[js] + p[js] > t:
+            t = tail[js] + p[js]
+        longest = max(longest, h + p[u] + t)
+        t += p[u]
+    return longest
+
+
+def _reversed_pairs(move, seqs):
+    # the pairs (a, b) with a in front of b before the move and behind it after
+    m, i, j, segment = move
+    before = {u: k for k, u in enumerate(seqs[m][i : j + 1])}
+    after = {u: k for k, u in enumerate(segment)}
+    return [(a, b) for a in segment for b in segment if before[a] < before[b] and after[a] > after[b]]
+
+
+def _chain(seq, i, j):
+    # the arcs of the sequence that change when the tasks i .. j are reordered
+    return [(seq[k], seq[k + 1]) for k in range(max(i - 1, 0), min(j + 1, len(seq) - 1))]
+
+
+def tabu_search(js, time_limit=1.0, iterations=None, neighborhood="N5", tenure=10):
+    """
+        improve the complete schedule of a Jobshop, the best schedule found is left in the Jobshop
+    :param js: Jobshop (or Shift) whose machines are all sequenced
+    :param time_limit: wall-clock seconds of the search, None for no limit
+    :param iterations: maximum number of moves, None for no limit
+    :param neighborhood: "N5" or "N7"
+    :param tenure: number of iterations a reversed pair of tasks stays tabu
+    :return: the makespan of the best schedule
+    """
+    if neighborhood not in neighborhoods:
+        raise ValueError("unknown neighborhood {!r}, expected one of {}".format(neighborhood, neighborhoods))
+    if time_limit is None and iterations is None:
+        raise ValueError("the tabu search needs a time limit or a number of iterations")
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    seqs = {}
+    for m, machine in js.machines.items():
+        seqs[m] = machine.sequence()
+        if seqs[m] is None:
+            raise ScheduleError("machine {} is not sequenced as a single chain".format(m))
+    machine = js.op_machine.tolist()
+    p = js.p.tolist()
+    job_prev = js.job_prev.tolist()
+    job_next = js.job_next.tolist()
+    pos = [0] * len(p)
+    for seq in seqs.values():
+        for k, u in enumerate(seq):
+            pos[u] = k
+    best = current = js.makespan()
+    best_seqs = {m: list(seq) for m, seq in seqs.items()}
+    tabu = {}
+    iteration = 0
+    while (iterations is None or iteration < iterations) and (deadline is None or time.perf_counter() < deadline):
+        iteration += 1
+        head, tail = js.head.tolist(), js.tail.tolist()
+        blocks = critical_blocks(seqs, pos, machine, head, tail, p, job_prev, current)
+        if neighborhood == "N5":
+            moves = _moves_n5(blocks, seqs)
+        else:
+            moves = _moves_n7(blocks, seqs, head, tail, p, job_prev, job_next)
+        if not moves:
+            # no block can be reordered, the critical path is a lower bound
+            break
+        chosen = None
+        for move in moves:
+            value = estimate(move, seqs, head, tail, p, job_prev, job_next)
+            pairs = _reversed_pairs(move, seqs)
+            allowed = value < best or not any(tabu.get(pair, 0) >= iteration for pair in pairs)
+            key = (not allowed, value)
+            if chosen is None or key < chosen[0]:
+                chosen = (key, move, pairs)
+        _, (m, i, j, segment), pairs = chosen
+        seq = seqs[m]
+        old = _chain(seq, i, j)
+        original = seq[i : j + 1]
+        seq[i : j + 1] = segment
+        new = _chain(seq, i, j)
+        js.remove_edges_from(old)
+        js.add_edges_from(new)
+        try:
+            current = js.makespan()
+        except CycleError:
+            # the estimate missed a cycle, undo the move and keep it tabu
+            js.remove_edges_from(new)
+            js.add_edges_from(old)
+            seq[i : j + 1] = original
+            current = js.makespan()
+            for a, b in pairs:
+                tabu[(a, b)] = iteration + tenure
+            continue
+        for k in range(i, j + 1):
+            pos[seq[k]] = k
+        for a, b in pairs:
+            # putting a in front of b again is tabu
+            tabu[(b, a)] = iteration + tenure
+        if current < best:
+            best = current
+            best_seqs = {m: list(s) for m, s in seqs.items()}
+    if current != best:
+        for m, seq in best_seqs.items():
+            if seq != seqs[m]:
+                js.remove_edges_from(list(zip(seqs[m][:-1], seqs[m][1:])))
+                js.add_edges_from(list(zip(seq[:-1], seq[1:])))
+    return js.makespan()
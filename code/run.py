@@ -1,47 +1,302 @@
-import os
-
-from ray import method
-
-from classes import Job, Shift
-
-
-def read_file_to_jobs(filename):
-    jobs = {}
-    job_num, machine_num = 0, 0  # task num is equal to machine num
-    with open(filename, "r") as f:
-        one_line = f.readline().split()
-        while one_line[0][0] == "#":
-            one_line = f.readline().split()
-        job_num, machine_num = one_line
-        job_num, machine_num = int(job_num), int(machine_num)
-        for j in range(job_num):
-            line_data = f.readline().split()
-            task_seq = []
-            process_time = []
-            for m in range(machine_num):
-                task_seq.append(int(line_data[2 * m]))
-                process_time.append(int(line_data[2 * m + 1]))
-            jobs[j] = Job(j, task_seq, process_time)
-    return jobs
-
-
-if __name__ == "__main__":
-    from config import *
-
-    dir_name = "instances/"
-    all_dataset = (
-        abz_dataset + dmu_dataset + ft_dataset + la_dataset + orb_dataset + swv_dataset + ta_dataset[:50] + yn_dataset
-    )
-    dataset = ["la11"]  # la_dataset
-    # method = {""}
-    for file_name in all_dataset:
-        try:
-            js = Shift()
-            jobs = read_file_to_jobs(os.path.join(dir_name, file_name))
-            js.addJobs(jobs)
-            js.criticalPath()
-            print(file_name)
-            print("start:", js.makespan())
-            js.shiftting_bottleneck()
-        except:
-            print("error:{}", file_name)
+import argparse
+import contextlib
+import csv
+import fnmatch
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import config
+import loader
+import localsearch
+from store import SolutionStore, fingerprint
+from classes import Job, Shift
+
+# dataset families of config.py, e.g. "la" -> config.la_dataset
+families = {name[: -len("_dataset")]: value for name, value in vars(config).items() if name.endswith("_dataset")}
+
+fields = [
+    "instance",
+    "status",
+    "jobs",
+    "machines",
+    "start",
+    "makespan",
+    "best_known",
+    "gap",
+    "iterations",
+    "optimal",
+    "runtime",
+    "cached",
+    "error",
+]
+
+
+def read_file_to_jobs(filename):
+    # task num is equal to machine num
+    routes, times = loader.read_jobshop(filename)
+    return {j: Job(j, route, processing) for j, (route, processing) in enumerate(zip(routes.tolist(), times.tolist()))}
+
+
+def solve(
+    filename,
+    budget=None,
+    beam=None,
+    seed=None,
+    improve=None,
+    neighborhood="N5",
+    screening=False,
+    store=None,
+    store_size=64,
+):
+    """
+        solve one instance with the shifting bottleneck procedure
+    :param filename:
+    :param budget: time limit in seconds of the procedure, see Shift
+    :param beam: (width, branching) of Shift.beam, None for the plain procedure
+    :param seed: seed of the tie-breaking between bottlenecks, see Shift
+    :param improve: seconds of tabu search on the final schedule, see localsearch.tabu_search
+    :param neighborhood: "N5" or "N7", the moves of the tabu search
+    :param screening: screen the bottleneck candidates with bounds, see Shift
+    :param store: SQLite file of a SolutionStore: a solution stored with the same settings is
+        returned as it is, the best one stored with other settings warm starts the Shift
+    :param store_size: size in MB of the store before it evicts solutions
+    :return: a result row, see fields
+    """
+    name = os.path.basename(filename)
+    start = time.perf_counter()
+    js = Shift(time_limit=budget, seed=seed, screening=screening)
+    jobs = read_file_to_jobs(filename)
+    if store is not None:
+        solutions = SolutionStore(store, store_size * 2**20)
+        key = fingerprint(jobs)
+        settings = {
+            "budget": budget,
+            "beam": beam,
+            "seed": seed,
+            "improve": improve,
+            "neighborhood": neighborhood if improve else None,
+            "screening": screening,
+        }
+        found = solutions.get(key, settings)
+        if found is not None:
+            solutions.close()
+            return dict(found["row"], instance=name, cached=True)
+        found = solutions.best(key)
+    js.addJobs(jobs)
+    if store is not None and found is not None:
+        js.warmStart(found["sequences"])
+    initial = js.makespan()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if beam is None:
+            js.shiftting_bottleneck()
+        else:
+            js.beam(*beam)
+    if improve:
+        localsearch.tabu_search(js, time_limit=improve, neighborhood=neighborhood)
+    makespan = js.makespan()
+    best = config.best_known.get(name)
+    row = {
+        "instance": name,
+        "status": "ok",
+        "jobs": len(jobs),
+        "machines": len(js.machines),
+        "start": initial,
+        "makespan": makespan,
+        "best_known": best,
+        "gap": round(100.0 * (makespan - best) / best, 2) if best else None,
+        "iterations": js.iterations,
+        "optimal": js.optimal,
+        "runtime": round(time.perf_counter() - start, 4),
+        "cached": False,
+    }
+    if store is not None:
+        solutions.put(key, settings, row, js.machineSequences())
+        solutions.close()
+    return row
+
+
+def _worker(conn, filename, memory, settings):
+    # runs in a child process, the memory cap (MB) limits the address space of the child only
+    if memory:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory * 2**20, memory * 2**20))
+    try:
+        conn.send(solve(filename, **settings))
+    except BaseException as e:
+        error = "{}: {}".format(type(e).__name__, e)
+        conn.send({"status": "error", "error": error, "traceback": traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+def select_instances(patterns, dir_name):
+    """
+        expand instance names, glob patterns and dataset families of config.py
+    :param patterns:
+    :param dir_name:
+    :return: the instance names in the given order without duplicates
+    """
+    # the instance files only, not e.g. the cache directory of loader.py
+    available = sorted(n for n in os.listdir(dir_name) if os.path.isfile(os.path.join(dir_name, n)))
+    names = []
+    for pattern in patterns:
+        if pattern == "all":
+            matched = [n for family in families.values() for n in family]
+        elif pattern in families:
+            matched = families[pattern]
+        elif any(c in pattern for c in "*?["):
+            matched = fnmatch.filter(available, pattern)
+        else:
+            matched = [pattern]
+        if not matched:
+            raise ValueError("no instance matches {!r}".format(pattern))
+        names.extend(n for n in matched if n not in names)
+    return names
+
+
+def run_batch(names, dir_name, workers, timeout=None, memory=None, **settings):
+    """
+        solve the instances in a pool of child processes, one process per instance
+    :param names:
+    :param dir_name:
+    :param workers: maximum number of instances solved at the same time
+    :param timeout: seconds after which an instance is killed
+    :param memory: address space cap in MB of every child
+    :param settings: keyword arguments of solve, e.g. budget (time limit in seconds of the procedure,
+        it returns the schedule found so far), beam, seed, improve, screening or store
+    :return: yields a result row as soon as an instance finishes
+    """
+    pending = list(names)
+    running = {}  # sentinel: (name, process, connection, start)
+    while pending or running:
+        while pending and len(running) < workers:
+            name = pending.pop(0)
+            recv, send = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_worker, args=(send, os.path.join(dir_name, name), memory, settings)
+            )
+            process.start()
+            send.close()
+            running[process.sentinel] = (name, process, recv, time.perf_counter())
+        deadlines = [start + timeout - time.perf_counter() for _, _, _, start in running.values()] if timeout else []
+        ready = wait(list(running), timeout=max(0, min(deadlines)) if deadlines else None)
+        now = time.perf_counter()
+        for sentinel in list(running):
+            name, process, recv, start = running[sentinel]
+            if sentinel in ready or recv.poll():
+                try:
+                    result = recv.recv()
+                except EOFError:
+                    result = {"status": "crashed", "error": "exit code {}".format(process.exitcode)}
+            elif timeout and now - start >= timeout:
+                process.kill()
+                result = {"status": "timeout", "error": "killed after {}s".format(timeout)}
+            else:
+                continue
+            process.join()
+            recv.close()
+            del running[sentinel]
+            result.setdefault("instance", name)
+            result.setdefault("runtime", round(now - start, 4))
+            yield result
+
+
+class ResultWriter(object):
+    """
+    A class that streams the result rows to a CSV or JSONL file, chosen by the file extension.
+    """
+
+    def __init__(self, filename):
+        self.jsonl = filename.endswith(".jsonl")
+        self.file = open(filename, "w", newline="")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve jobshop instances with the shifting bottleneck procedure.")
+    parser.add_argument(
+        "instances",
+        nargs="*",
+        default=["all"],
+        help="instance names, glob patterns or dataset families ({}), default: all".format(", ".join(families)),
+    )
+    parser.add_argument("-d", "--dir", default="instances/", help="directory of the instance files")
+    parser.add_argument("-o", "--output", default="result/results.csv", help="CSV or JSONL (.jsonl) result file")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="time limit per instance in seconds")
+    parser.add_argument(
+        "-b", "--budget", type=float, default=None, help="time limit per instance after which the best schedule is kept"
+    )
+    parser.add_argument("-m", "--memory", type=int, default=None, help="memory cap per instance in MB")
+    parser.add_argument(
+        "--beam", type=int, nargs=2, default=None, metavar=("WIDTH", "BRANCHING"), help="beam search, see Shift.beam"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="seed of the tie-breaking between bottlenecks")
+    parser.add_argument(
+        "--improve", type=float, default=None, metavar="SECONDS", help="tabu search on the final schedule"
+    )
+    parser.add_argument(
+        "--neighborhood", choices=localsearch.neighborhoods, default="N5", help="moves of the tabu search"
+    )
+    parser.add_argument(
+        "--screening", action="store_true", help="only solve the bottleneck candidates whose bounds can win"
+    )
+    parser.add_argument("--store", default=None, help="SQLite file of the solutions, reused and warm started from")
+    parser.add_argument("--store-size", type=int, default=64, help="size in MB of the store before it evicts")
+    args = parser.parse_args(argv)
+
+    names = select_instances(args.instances, args.dir)
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    writer = ResultWriter(args.output)
+    failed = 0
+    try:
+        rows = run_batch(
+            names,
+            args.dir,
+            args.workers,
+            args.timeout,
+            args.memory,
+            budget=args.budget,
+            beam=args.beam,
+            seed=args.seed,
+            improve=args.improve,
+            neighborhood=args.neighborhood,
+            screening=args.screening,
+            store=args.store,
+            store_size=args.store_size,
+        )
+        for row in rows:
+            writer.write(row)
+            if row["status"] == "ok":
+                cached = " (stored)" if row.get("cached") else ""
+                print("{instance}: makespan {makespan}, gap {gap}%, {runtime}s".format(**row) + cached)
+            else:
+                failed += 1
+                print("{instance}: {status} ({error})".format(**row), file=sys.stderr)
+    finally:
+        writer.close()
+    print("{} instances, {} failed, results in {}".format(len(names), failed, args.output))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+A persistent store of jobshop solutions in a SQLite file.
+
+An instance is identified by the fingerprint of its parsed jobs (the ids, routes and processing
+times in the order they are added), so a renamed or copied instance file still hits. Every
+solution is stored with the solver settings it was found with: the result row, the makespan, the
+runtime and the final sequence of every machine as job ids. "get" returns the solution of the same
+settings, "best" the best solution of any settings, e.g. to warm start a Shift (see
+Shift.warmStart). Once the stored solutions take more than "max_size" bytes, the least recently
+used ones are evicted.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+schema = """
+CREATE TABLE IF NOT EXISTS solutions (
+    fingerprint TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    makespan INTEGER NOT NULL,
+    runtime REAL,
+    row TEXT NOT NULL,
+    sequences TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (fingerprint, settings)
+)
+"""
+
+
+def fingerprint(jobs):
+    """
+        the SHA-256 of the ids, routes and processing times of the jobs
+    :param jobs: dictionary of Job
+    :return: hex digest
+    """
+    data = [[j.Id, list(j.r), list(j.p)] for j in jobs.values()]
+    return hashlib.sha256(json.dumps(data, separators=(",", ":")).encode()).hexdigest()
+
+
+class SolutionStore(object):
+    """
+    A class that keeps the solutions of jobshop instances in a SQLite file.
+
+    Parameters
+    ----------
+    filename: str - SQLite file, created if needed
+    max_size: int - Bytes of stored solutions kept before the least recently used ones are evicted
+
+    Attributes
+    ----------
+    hits: int - Number of "get" calls that found a solution
+    misses: int - Number of "get" calls that found nothing
+    """
+
+    def __init__(self, filename, max_size=64 * 2**20):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # the worker processes of run.py may write at the same time
+        self._db = sqlite3.connect(filename, timeout=60)
+        self._db.execute(schema)
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def size(self):
+        # bytes of the stored solutions
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM solutions").fetchone()[0]
+
+    def get(self, key, settings):
+        """
+            the solution of an instance found with the same settings
+        :param key: fingerprint of the instance
+        :param settings: dictionary of the solver settings
+        :return: dictionary with "makespan", "runtime", "row", "sequences" and "settings", None if
+            there is none
+        """
+        found = self._select("fingerprint = ? AND settings = ?", (key, _settings(settings)))
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def best(self, key):
+        """
+            the solution with the smallest makespan of an instance, whatever the settings
+        :param key: fingerprint of the instance
+        :return: see get
+        """
+        return self._select("fingerprint = ? ORDER BY makespan, runtime", (key,))
+
+    def put(self, key, settings, row, sequences):
+        """
+            store a solution, replacing the one of the same instance and settings
+        :param key: fingerprint of the instance
+        :param settings: dictionary of the solver settings
+        :param row: result row, must hold "makespan" and "runtime"
+        :param sequences: {machine id: [job ids in processing order]}
+        :return:
+        """
+        makespan, runtime = row["makespan"], row["runtime"]
+        row = json.dumps(row)
+        sequences = json.dumps({str(m): seq for m, seq in sequences.items()}, separators=(",", ":"))
+        settings = _settings(settings)
+        size = len(key) + len(settings) + len(row) + len(sequences)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, settings, makespan, runtime, row, sequences, size, time.time()),
+            )
+            self._evict()
+
+    def _select(self, where, args):
+        found = self._db.execute(
+            "SELECT rowid, settings, makespan, runtime, row, sequences FROM solutions WHERE " + where + " LIMIT 1", args
+        ).fetchone()
+        if found is None:
+            return None
+        rowid, settings, makespan, runtime, row, sequences = found
+        with self._db:
+            self._db.execute("UPDATE solutions SET used = ? WHERE rowid = ?", (time.time(), rowid))
+        return {
+            "settings": json.loads(settings),
+            "makespan": makespan,
+            "runtime": runtime,
+            "row": json.loads(row),
+            "sequences": {int(m): seq for m, seq in json.loads(sequences).items()},
+        }
+
+    def _evict(self):
+        # drop the least recently used solutions until the store fits in max_size
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        freed = 0
+        doomed = []
+        for rowid, size in self._db.execute("SELECT rowid, size FROM solutions ORDER BY used"):
+            if freed >= excess:
+                break
+            doomed.append((rowid,))
+            freed += size
+        self._db.executemany("DELETE FROM solutions WHERE rowid = ?", doomed)
+
+
+def _settings(settings):
+    # a canonical text of the settings, the key of a solution with the fingerprint
+    return json.dumps(settings, sort_keys=True, separators=(",", ":"))
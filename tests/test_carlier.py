@@ -0,0 +1,85 @@
+"""
+Checks of the single machine solvers against brute force on small random instances: CarlierSolver
+in every search and selection mode, with and without elimination, the Schrage bounds, and solvers
+running inside one another or in threads. Run with pytest (a few hundred instances) or as a
+script, e.g. "python tests/test_carlier.py 3000".
+"""
+import concurrent.futures
+import itertools
+import os
+import random
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "code"))
+
+import carlier  # noqa: E402
+
+
+def random_tasks(rng, n):
+    # [release time, process time, tail time], small ranges so ties are frequent
+    return [[rng.randint(0, 30), rng.randint(1, 15), rng.randint(0, 30)] for _ in range(n)]
+
+
+def brute_force(tasks):
+    # the optimal Cmax over every permutation
+    return min(carlier.sequence_Cmax(tasks, seq) for seq in itertools.permutations(range(len(tasks))))
+
+
+def test_brute_force(count=300, seed=0):
+    rng = random.Random(seed)
+    for k in range(count):
+        tasks = random_tasks(rng, rng.randint(1, 7))
+        optimum = brute_force(tasks)
+        assert carlier.Schrage_pmtn(tasks) <= optimum <= carlier.Schrage(tasks)[1], (k, tasks)
+        for elimination, search, selection in itertools.product(
+            (True, False), carlier.CarlierSolver.searches, (False, True)
+        ):
+            copy = [list(task) for task in tasks]
+            solver = carlier.CarlierSolver(elimination=elimination, search=search, selection=selection)
+            LB, UB, seq = solver.solve(copy)
+            mode = (k, elimination, search, selection, tasks)
+            assert copy == tasks, mode
+            assert UB == optimum and solver.optimal, mode
+            assert sorted(seq) == list(range(len(tasks))) and carlier.sequence_Cmax(tasks, seq) == UB, mode
+            assert LB <= UB, mode
+            # an initial upper bound is only beaten by a better sequence
+            assert carlier.CarlierSolver(UB=optimum + 1, search=search, selection=selection).solve(tasks)[1] == optimum
+            assert carlier.CarlierSolver(UB=optimum, search=search, selection=selection).solve(tasks)[2] is None
+
+
+def test_limits(seed=1):
+    # a cut search still returns a sequence with its Cmax, at least the Schrage one
+    rng = random.Random(seed)
+    for _ in range(50):
+        tasks = random_tasks(rng, 30)
+        solver = carlier.CarlierSolver(node_limit=1)
+        LB, UB, seq = solver.solve(tasks)
+        assert carlier.sequence_Cmax(tasks, seq) == UB <= carlier.Schrage(tasks)[1]
+        assert LB <= UB
+
+
+def test_reentrant(seed=2):
+    # solvers started from inside another search, or in threads, keep their own incumbent
+    rng = random.Random(seed)
+    instances = [random_tasks(rng, 7) for _ in range(40)]
+    optima = [brute_force(tasks) for tasks in instances]
+    nested = []
+
+    def on_node(node, U, LB, elapsed):
+        tasks = instances[len(nested) % len(instances)]
+        nested.append((len(nested) % len(instances), carlier.CarlierSolver(search="best").solve(tasks)[1]))
+
+    for tasks, optimum in zip(instances, optima):
+        assert carlier.CarlierSolver(on_node=on_node).solve(tasks)[1] == optimum
+    assert nested and all(U == optima[k] for k, U in nested)
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda tasks: carlier.CarlierSolver().solve(tasks)[1], instances * 5))
+    assert results == optima * 5
+
+
+if __name__ == "__main__":
+    test_brute_force(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
+    test_limits()
+    test_reentrant()
+    print("ok")
@@ -0,0 +1,77 @@
+"""
+Checks of the tabu search moves: no move of N7 left by the Balas and Vazacopoulos filter closes a
+cycle, and the search keeps a valid schedule. Run with pytest or as a script from anywhere.
+"""
+import contextlib
+import os
+import sys
+
+import networkx as nx
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "code"))
+
+import localsearch  # noqa: E402
+import run  # noqa: E402
+from classes import Shift  # noqa: E402
+
+instances = ["ft10", "la16", "abz5", "orb01", "la21", "swv01", "ta01"]
+
+
+def solved(name):
+    js = Shift()
+    js.addJobs(run.read_file_to_jobs(os.path.join(root, "instances", name)))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        js.shiftting_bottleneck()
+    return js
+
+
+def _moves(js):
+    # the N7 moves of the critical path of the schedule of js
+    seqs = {m: machine.sequence() for m, machine in js.machines.items()}
+    pos = [0] * len(js)
+    for seq in seqs.values():
+        for k, u in enumerate(seq):
+            pos[u] = k
+    head, tail, p = js.head.tolist(), js.tail.tolist(), js.p.tolist()
+    job_prev, job_next = js.job_prev.tolist(), js.job_next.tolist()
+    blocks = localsearch.critical_blocks(seqs, pos, js.op_machine.tolist(), head, tail, p, job_prev, js.makespan())
+    return seqs, localsearch._moves_n7(blocks, seqs, head, tail, p, job_prev, job_next)
+
+
+def _acyclic(js, seqs, move):
+    # whether the graph of the schedule stays acyclic after the move
+    m, i, j, segment = move
+    G = nx.DiGraph()
+    G.add_edges_from((u, v) for u, v in enumerate(js.job_next.tolist()) if v >= 0)
+    for n, seq in seqs.items():
+        if n == m:
+            seq = seq[:i] + segment + seq[j + 1 :]
+        G.add_edges_from(zip(seq[:-1], seq[1:]))
+    return nx.is_directed_acyclic_graph(G)
+
+
+def test_n7_moves_acyclic():
+    for name in instances:
+        js = solved(name)
+        for _ in range(5):
+            seqs, moves = _moves(js)
+            for move in moves:
+                assert _acyclic(js, seqs, move), (name, move)
+            # a few tabu moves away from the shifting bottleneck schedule
+            localsearch.tabu_search(js, time_limit=None, iterations=3, neighborhood="N7")
+
+
+def test_tabu_search_valid():
+    for neighborhood in localsearch.neighborhoods:
+        js = solved("ft10")
+        start = js.makespan()
+        best = localsearch.tabu_search(js, time_limit=None, iterations=200, neighborhood=neighborhood)
+        js.validate()
+        assert best == js.makespan() <= start
+
+
+if __name__ == "__main__":
+    test_n7_moves_acyclic()
+    test_tabu_search_valid()
+    print("ok")
@@ -0,0 +1,133 @@
+"""
+Checks of the head and tail passes of Jobshop: the incremental propagation, the level by level
+passes and the operation by operation passes give the same timing as longest paths computed with
+networkx, through random sequence changes, toggles that restore an earlier timing and changes of
+processing times. Run with pytest or as a script, e.g. "python tests/test_propagation.py 200".
+"""
+import contextlib
+import os
+import random
+import sys
+
+import networkx as nx
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "code"))
+
+import run  # noqa: E402
+from classes import Job, Jobshop, Shift  # noqa: E402
+
+
+def random_jobs(rng, n, m):
+    return {j: Job(j, rng.sample(range(m), m), [rng.randint(1, 20) for _ in range(m)]) for j in range(n)}
+
+
+def random_sequences(rng, js):
+    # the machine sequences of a random interleaving of the jobs, always acyclic
+    order = [j for j in js._job_first for _ in range(js._job_first[j][1])]
+    rng.shuffle(order)
+    done = dict.fromkeys(js._job_first, 0)
+    seqs = {m: [] for m in js.machines}
+    for j in order:
+        i = js._job_first[j][0] + done[j]
+        done[j] += 1
+        seqs[int(js.op_machine[i])].append(i)
+    return seqs
+
+
+def shops(jobs):
+    # incremental, level by level and operation by operation
+    result = [Jobshop(incremental=True), Jobshop(incremental=False), Jobshop(incremental=False)]
+    result[1].level_width = 0
+    result[2].level_width = sys.maxsize
+    for js in result:
+        js.addJobs(jobs)
+    return result
+
+
+def reference(js, seqs):
+    # heads, tails and makespan as longest paths in networkx, None if the graph has a cycle
+    G = nx.DiGraph()
+    G.add_nodes_from(range(len(js)))
+    G.add_edges_from((u, v) for u, v in enumerate(js.job_next.tolist()) if v >= 0)
+    for seq in seqs.values():
+        G.add_edges_from(zip(seq[:-1], seq[1:]))
+    if not nx.is_directed_acyclic_graph(G):
+        return None
+    p = js.p.tolist()
+    order = list(nx.topological_sort(G))
+    head = [0] * len(js)
+    tail = [0] * len(js)
+    for v in order:
+        head[v] = max((head[u] + p[u] for u in G.predecessors(v)), default=0)
+    for u in reversed(order):
+        tail[u] = max((tail[v] + p[v] for v in G.successors(u)), default=0)
+    return head, tail, max((h + d for h, d in zip(head, p)), default=0)
+
+
+def check(all_js, seqs, where):
+    head, tail, makespan = reference(all_js[0], seqs)
+    for js in all_js:
+        assert js.makespan() == makespan, where
+        assert js.head.tolist() == head and js.tail.tolist() == tail, where
+        critical = np.flatnonzero(np.array(head) + js.p + np.array(tail) == makespan)
+        assert np.array_equal(js.criticalOperations(), critical), where
+
+
+def test_random_changes(count=30, seed=0):
+    rng = random.Random(seed)
+    for k in range(count):
+        all_js = shops(random_jobs(rng, rng.randint(2, 8), rng.randint(2, 6)))
+        seqs = {m: [] for m in all_js[0].machines}
+        target = random_sequences(rng, all_js[0])
+        for m, seq in target.items():
+            # the sequences go in one machine at a time, as in the shifting bottleneck
+            seqs[m] = seq
+            for js in all_js:
+                js.add_edges_from(zip(seq[:-1], seq[1:]))
+            check(all_js, seqs, (k, "add", m))
+        for step in range(30):
+            m = rng.choice(list(seqs))
+            seq = seqs[m]
+            move = rng.choice(("replace", "toggle", "p"))
+            if move == "p":
+                i = rng.randrange(len(all_js[0]))
+                p = rng.randint(1, 20)
+                for js in all_js:
+                    js.setProcessingTime(i, p)
+            else:
+                new = list(seq)
+                if move == "replace":
+                    rng.shuffle(new)
+                    if reference(all_js[0], {**seqs, m: new}) is None:
+                        continue
+                for js in all_js:
+                    js.remove_edges_from(list(zip(seq[:-1], seq[1:])))
+                # the timing without the machine, then with its new (or the same) sequence
+                check(all_js, {**seqs, m: []}, (k, step, move, "removed"))
+                for js in all_js:
+                    js.add_edges_from(zip(new[:-1], new[1:]))
+                seqs[m] = new
+            check(all_js, seqs, (k, step, move))
+
+
+def test_shift_modes():
+    # the shifting bottleneck takes the same decisions with every kind of pass
+    for name in ["ft10", "la21", "abz5"]:
+        jobs = run.read_file_to_jobs(os.path.join(root, "instances", name))
+        makespans = []
+        for incremental, level_width in [(True, Jobshop.level_width), (False, 0), (False, sys.maxsize)]:
+            js = Shift(incremental=incremental)
+            js.level_width = level_width
+            js.addJobs(jobs)
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                makespans.append(js.shiftting_bottleneck())
+            js.validate()
+        assert len(set(makespans)) == 1, (name, makespans)
+
+
+if __name__ == "__main__":
+    test_random_changes(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
+    test_shift_modes()
+    print("ok")